@@ -1,47 +1,308 @@
+"""Audit logging
+
+Records are written to time-segmented files under audit/ (or to
+audit.log if app_audit_segments is off), errors also to error.log, and
+slow request traces to slow.log, by a background thread. The request
+path only puts the record on a bounded queue, so disk latency does not
+add to API latency.
+"""
+import asyncio
+import atexit
+import hashlib
+import json
 import logging
+import logging.handlers
 import os
+import queue
+from typing import AsyncIterator, Awaitable, Callable, Dict
+
+import anyio
+from starlette.concurrency import run_in_threadpool
+
+from .auditstore import SegmentedAuditHandler
 from .config import get_settings
 
-__all__ = ["logger"]
+__all__ = [
+    "logger",
+    "slow_logger",
+    "audit_stats",
+    "audited_stream",
+    "audit_directory",
+    "dumps_with_fragments",
+    "json_fragment",
+    "start_audit_listener",
+    "stop_audit_listener",
+    "write_audit",
+]
 
 settings = get_settings()
 
-LOGGING = {
-    "version": 1,
-    "disable_existing_loggers": False,
-    "formatters": {
-        "basic": {
-            "format": "%(message)s",
-        },
-    },
-    "handlers": {
-        "null": {"class": "logging.NullHandler"},
-        "console": {
-            "level": "DEBUG",
-            "class": "logging.StreamHandler",
-            "formatter": "basic",
-        },
-        "audit_file": {
-            "level": "INFO",
-            "class": "logging.handlers.WatchedFileHandler",
-            "formatter": "basic",
-            "filename": os.path.join(settings.app_log_path, "audit.log"),
-        },
-        "error_file": {
-            "level": "ERROR",
-            "class": "logging.handlers.WatchedFileHandler",
-            "formatter": "basic",
-            "filename": os.path.join(settings.app_log_path, "error.log"),
-        },
-    },
-    "loggers": {
-        "audit": {
-            "handlers": ["null", "audit_file", "error_file"],
-            "level": "DEBUG",
-            "propogate": False,
-        }
-    },
-}
-
-logging.config.dictConfig(LOGGING)
+
+class BatchedWatchedFileHandler(logging.handlers.WatchedFileHandler):
+    """A WatchedFileHandler that leaves flushing to its caller.
+
+    Records are written to the stream as they are handled, but the stream
+    is only flushed when flush_batch() is called, once per batch.
+    """
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        logging.StreamHandler.flush(self)
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class AuditQueueHandler(logging.handlers.QueueHandler):
+    """Puts records on a bounded queue, counting records that are dropped.
+
+    When the queue is full, records are dropped immediately unless block
+    is True, in which case the caller waits up to timeout seconds for
+    space before the record is dropped. Waiting on the event loop would
+    stall every request in the worker, so records logged from the loop
+    thread are never waited for; log from async code with write_audit.
+    """
+
+    def __init__(self, q: queue.Queue, block: bool = False, timeout: float = 1.0):
+        super().__init__(q)
+        self.block = block
+        self.timeout = timeout
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            if self.block and not _on_event_loop():
+                self.queue.put(record, timeout=self.timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """A QueueListener that drains up to batch_size records at a time.
+
+    Handlers are flushed once per batch rather than once per record.
+    """
+
+    def __init__(self, q: queue.Queue, *handlers, batch_size: int = 100):
+        super().__init__(q, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def enqueue_sentinel(self):
+        # Wait for room rather than fail when the queue is full at shutdown
+        self.queue.put(self._sentinel)
+
+    def _monitor(self):
+        q = self.queue
+        has_task_done = hasattr(q, "task_done")
+        stop = False
+        while not stop:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    self.handle(record)
+                if has_task_done:
+                    q.task_done()
+            for handler in self.handlers:
+                if hasattr(handler, "flush_batch"):
+                    handler.flush_batch()
+
+
+formatter = logging.Formatter("%(message)s")
+
+audit_directory = os.path.join(settings.app_log_path, "audit")
+
+if settings.app_audit_segments:
+    audit_file = SegmentedAuditHandler(
+        audit_directory, interval=settings.app_audit_segment_interval
+    )
+else:
+    audit_file = BatchedWatchedFileHandler(
+        os.path.join(settings.app_log_path, "audit.log")
+    )
+audit_file.setLevel(logging.INFO)
+audit_file.setFormatter(formatter)
+
+error_file = BatchedWatchedFileHandler(
+    os.path.join(settings.app_log_path, "error.log")
+)
+error_file.setLevel(logging.ERROR)
+error_file.setFormatter(formatter)
+
+slow_file = BatchedWatchedFileHandler(os.path.join(settings.app_log_path, "slow.log"))
+slow_file.setLevel(logging.INFO)
+slow_file.setFormatter(formatter)
+
+# The loggers share one queue, so each file only takes its own logger's records
+audit_file.addFilter(logging.Filter("audit"))
+error_file.addFilter(logging.Filter("audit"))
+slow_file.addFilter(logging.Filter("slow"))
+
+audit_queue = queue.Queue(maxsize=settings.app_audit_queue_size)
+queue_handler = AuditQueueHandler(
+    audit_queue, block=settings.app_audit_queue_policy == "block"
+)
+listener = BatchingQueueListener(
+    audit_queue,
+    audit_file,
+    error_file,
+    slow_file,
+    batch_size=settings.app_audit_batch_size,
+)
+
 logger = logging.getLogger("audit")
+logger.setLevel(logging.DEBUG)
+logger.addHandler(queue_handler)
+logger.propagate = False
+
+slow_logger = logging.getLogger("slow")
+slow_logger.setLevel(logging.INFO)
+slow_logger.addHandler(queue_handler)
+slow_logger.propagate = False
+
+
+# The process that started the writer thread
+_listener_pid = None
+
+
+def _forget_forked_listener() -> None:
+    """Private: Drop a writer thread inherited from the parent of a fork."""
+    if listener._thread is not None and _listener_pid != os.getpid():
+        listener._thread = None
+
+
+def start_audit_listener() -> None:
+    """Start writing queued audit records. Safe to call more than once.
+
+    Call it from each worker's startup hook rather than at import. A
+    worker forked after the writer started (gunicorn --preload) inherits
+    a thread that does not run in it, so it starts its own here."""
+    global _listener_pid
+    _forget_forked_listener()
+    if listener._thread is None:
+        listener.start()
+        _listener_pid = os.getpid()
+
+
+def stop_audit_listener() -> None:
+    """Write any queued audit records, then stop the writer thread."""
+    _forget_forked_listener()
+    if listener._thread is not None:
+        listener.stop()
+
+
+def audit_stats() -> Dict:
+    """Returns queue depth and the number of dropped audit records."""
+    return {
+        "queued": audit_queue.qsize(),
+        "maxsize": audit_queue.maxsize,
+        "policy": settings.app_audit_queue_policy,
+        "dropped": queue_handler.dropped,
+    }
+
+
+async def write_audit(log: logging.Logger, message: str, **kwargs) -> None:
+    """Log an audit record from async code without blocking the event loop.
+
+    Under the block policy the record is put on the queue from the
+    threadpool, so only the request being logged waits for room.
+    """
+    if queue_handler.block:
+        await run_in_threadpool(log.info, message, **kwargs)
+    else:
+        log.info(message, **kwargs)
+
+
+def json_fragment(body: bytes, is_json: bool = True) -> str:
+    """Returns a request or response body as a JSON fragment for a record.
+
+    A body that is known to be JSON is embedded as is, without being
+    parsed and serialized again. Anything else is embedded as a string.
+    Bodies over app_audit_body_max_bytes are replaced by a truncated
+    string prefix and the original length.
+    """
+    if body is None:
+        return "null"
+    limit = settings.app_audit_body_max_bytes
+    if len(body) > limit:
+        return json.dumps(
+            {
+                "truncated": True,
+                "length": len(body),
+                "prefix": body[:limit].decode("utf-8", errors="replace"),
+            },
+            separators=(",", ":"),
+        )
+    if is_json and body:
+        # Newlines can only appear between tokens in valid JSON, so this
+        # keeps the record on one line without changing its meaning
+        return body.decode("utf-8", errors="replace").replace("\r", " ").replace(
+            "\n", " "
+        )
+    return json.dumps(body.decode("utf-8", errors="replace"))
+
+
+def dumps_with_fragments(record: Dict, fragments: Dict[str, str]) -> str:
+    """Serialize a record, splicing in pre-serialized JSON fragments.
+
+    Each key of fragments must appear in the record as a placeholder
+    string value, which is replaced by the matching fragment.
+    """
+    line = json.dumps(record, separators=(",", ":"))
+    for placeholder, fragment in fragments.items():
+        line = line.replace(json.dumps(placeholder), fragment, 1)
+    return line
+
+
+async def audited_stream(
+    iterator: AsyncIterator, on_complete: Callable[[Dict], Awaitable[None]]
+) -> AsyncIterator[bytes]:
+    """Pass a streaming response body through, summarizing it as it goes.
+
+    Counts bytes and chunks and hashes the payload incrementally, so the
+    body is never held in memory. When the stream ends, or the client goes
+    away, on_complete is awaited with the summary, shielded from the
+    cancellation of a disconnected request.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    chunks = 0
+    complete = False
+    try:
+        async for chunk in iterator:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            digest.update(chunk)
+            size += len(chunk)
+            chunks += 1
+            yield chunk
+        complete = True
+    finally:
+        with anyio.CancelScope(shield=True):
+            await on_complete(
+                {
+                    "streamed": True,
+                    "complete": complete,
+                    "bytes": size,
+                    "chunks": chunks,
+                    "sha256": digest.hexdigest(),
+                }
+            )
+
+
+atexit.register(stop_audit_listener)
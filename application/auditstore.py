@@ -0,0 +1,271 @@
+"""Time-segmented, indexed storage for audit records
+
+Each worker writes audit records to its own segment file, starting a new
+segment every app_audit_segment_interval seconds and gzipping the one it
+closes. Next to every segment is a small JSON index of the operations,
+usernames, status codes, methods and path parameter values it contains,
+plus the time of its first and last record. Queries read the indexes
+first and only open the segments that can contain matching records.
+"""
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+__all__ = ["SegmentedAuditHandler", "query_segments"]
+
+INDEX_FIELDS = ("operation_id", "username", "status_code", "method", "resources")
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+
+def _new_index(segment: str) -> Dict:
+    index = {"segment": segment, "first": None, "last": None, "count": 0}
+    for field in INDEX_FIELDS:
+        index[field] = {}
+    return index
+
+
+def _write_json(path: str, data: Dict) -> None:
+    """Private: Atomically replace path with data serialized as JSON."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _compress(path: str) -> None:
+    """Private: Replace path with a gzipped copy of itself.
+
+    If the gzipped file already exists, the copy is appended to it as a
+    new gzip member, so nothing already compressed is lost.
+    """
+    with open(path, "rb") as src, gzip.open(path + ".gz", "ab") as dest:
+        shutil.copyfileobj(src, dest)
+    os.remove(path)
+
+
+class SegmentedAuditHandler(logging.Handler):
+    """Writes audit records to time-segmented files with sidecar indexes.
+
+    Index values are taken from the "audit" attribute that LoggingRoute
+    attaches to each record, so records are never parsed to index them.
+    Like BatchedWatchedFileHandler, writes are only flushed, and the index
+    only saved, when flush_batch() is called.
+    """
+
+    def __init__(self, directory: str, interval: int = 3600, compress: bool = True):
+        super().__init__()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.interval = interval
+        self.compress = compress
+        self.segment = None
+        self.stream = None
+        self.index = None
+        self._dirty = False
+        self._pid = None
+        self._writer = None
+
+    def _writer_id(self) -> str:
+        """Private: Returns an ID unique to this handler in this process.
+
+        Pids are reused when workers restart, so a random suffix keeps a
+        new worker from writing to the segments of an old one. The ID is
+        renewed after a fork.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._writer = "{0}-{1}".format(self._pid, uuid.uuid4().hex[:12])
+        return self._writer
+
+    def _segment_name(self, created: float) -> str:
+        start = time.gmtime(created - created % self.interval)
+        return "{0}-{1}".format(
+            time.strftime("%Y%m%dT%H%M%S", start), self._writer_id()
+        )
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.directory, self.segment + suffix)
+
+    def _open_segment(self, name: str) -> None:
+        self._close_segment()
+        self.segment = name
+        try:
+            with open(self._path(".idx.json"), encoding="utf-8") as fh:
+                self.index = json.load(fh)
+        except (OSError, ValueError):
+            self.index = _new_index(name)
+        self.stream = open(self._path(".jsonl"), "a", encoding="utf-8")
+
+    def _close_segment(self) -> None:
+        if self.stream is None:
+            return
+        self.flush_batch()
+        self.stream.close()
+        self.stream = None
+        if self.compress:
+            _compress(self._path(".jsonl"))
+
+    def _update_index(self, record: logging.LogRecord) -> None:
+        index = self.index
+        if index["first"] is None:
+            index["first"] = record.created
+        index["last"] = record.created
+        index["count"] += 1
+        fields = getattr(record, "audit", None) or {}
+        for field in INDEX_FIELDS:
+            values = fields.get(field)
+            if values is None:
+                continue
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            for value in values:
+                key = str(value)
+                index[field][key] = index[field].get(key, 0) + 1
+        self._dirty = True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            name = self._segment_name(record.created)
+            if name != self.segment:
+                self._open_segment(name)
+            self.stream.write(self.format(record) + "\n")
+            self._update_index(record)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        pass
+
+    def flush_batch(self) -> None:
+        self.acquire()
+        try:
+            if self.stream is not None:
+                self.stream.flush()
+                if self._dirty:
+                    _write_json(self._path(".idx.json"), self.index)
+                    self._dirty = False
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            self._close_segment()
+        finally:
+            self.release()
+        super().close()
+
+
+def _epoch(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _index_matches(index: Dict, filters: Dict, since, until, writes_only) -> bool:
+    if since is not None and (index["last"] or 0) < since:
+        return False
+    if until is not None and (index["first"] or 0) > until:
+        return False
+    for field, value in filters.items():
+        if str(value) not in index.get(field, {}):
+            return False
+    if writes_only and not any(m in index["method"] for m in WRITE_METHODS):
+        return False
+    return True
+
+
+def _record_matches(record: Dict, filters: Dict, since, until, writes_only) -> bool:
+    request = record.get("request", {})
+    response = record.get("response", {})
+    claims = request.get("jwt_claimset") or {}
+    fields = {
+        "operation_id": record.get("operation_id"),
+        "username": claims.get("tapis/username"),
+        "status_code": response.get("status_code"),
+        "method": request.get("method"),
+    }
+    for field, value in filters.items():
+        if field == "resources":
+            path_params = request.get("path_params") or {}
+            if str(value) not in [str(v) for v in path_params.values()]:
+                return False
+        elif str(fields.get(field)) != str(value):
+            return False
+    if writes_only and fields["method"] not in WRITE_METHODS:
+        return False
+    if since is not None or until is not None:
+        created = _epoch(datetime.strptime(record["timestamp"], TIMESTAMP_FORMAT))
+        if since is not None and created < since:
+            return False
+        if until is not None and created > until:
+            return False
+    return True
+
+
+def _read_segment(directory: str, segment: str) -> Iterator[Dict]:
+    path = os.path.join(directory, segment + ".jsonl")
+    # A reopened segment may have a compressed part and an open part
+    for part, opener in ((path + ".gz", gzip.open), (path, open)):
+        if not os.path.exists(part):
+            continue
+        with opener(part, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Skip a partly written last line
+                    continue
+
+
+def query_segments(
+    directory: str,
+    operation_id: str = None,
+    username: str = None,
+    status_code: int = None,
+    resource: str = None,
+    writes_only: bool = False,
+    since: datetime = None,
+    until: datetime = None,
+    limit: int = 100,
+) -> List[Dict]:
+    """Returns up to limit matching audit records, newest segment first."""
+    filters = {
+        "operation_id": operation_id,
+        "username": username,
+        "status_code": status_code,
+        "resources": resource,
+    }
+    filters = {k: v for k, v in filters.items() if v is not None}
+    since = _epoch(since)
+    until = _epoch(until)
+
+    indexes = []
+    for path in glob.glob(os.path.join(directory, "*.idx.json")):
+        try:
+            with open(path, encoding="utf-8") as fh:
+                indexes.append(json.load(fh))
+        except (OSError, ValueError):
+            continue
+    indexes.sort(key=lambda i: i["first"] or 0, reverse=True)
+
+    results = []
+    for index in indexes:
+        if not _index_matches(index, filters, since, until, writes_only):
+            continue
+        for record in _read_segment(directory, index["segment"]):
+            if _record_matches(record, filters, since, until, writes_only):
+                results.append(record)
+                if len(results) >= limit:
+                    return results
+    return results
@@ -0,0 +1,166 @@
+"""Small in-process caches used to avoid repeated upstream calls"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+__all__ = ["SharedGeneration", "TTLCache", "token_key"]
+
+_MISSING = object()
+
+
+def token_key(token: str) -> str:
+    """Returns a stable, non-reversible cache key for a bearer token.
+
+    Raw tokens are never used as keys so they cannot leak through
+    cache introspection or stats endpoints."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TTLCache(object):
+    """Thread-safe LRU cache whose entries expire after a time-to-live.
+
+    Each entry may carry its own expiry (for example, the ``exp`` claim
+    of a JWT), which is capped by the cache-wide ``ttl``. When the cache
+    is full the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value for key, or default if absent or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(
+        self, key: Hashable, value: Any, expires_at: Optional[float] = None
+    ) -> None:
+        """Stores value under key.
+
+        The entry expires after ``ttl`` seconds or at ``expires_at``
+        (a UNIX timestamp), whichever comes first."""
+        max_expiry = time.time() + self.ttl
+        if expires_at is None or expires_at > max_expiry:
+            expires_at = max_expiry
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> Any:
+        """Removes key from the cache, returning its value if present."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is not None:
+            return entry[0]
+        return None
+
+    def invalidate_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Removes all entries whose value satisfies predicate.
+
+        Returns the number of entries removed."""
+        with self._lock:
+            keys = [k for k, (v, _) in self._data.items() if predicate(v)]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        """Returns size and hit/miss counters for this cache."""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class SharedGeneration(object):
+    """A generation stamp in a file, shared by every worker that can see it.
+
+    Bumping the stamp tells the other workers that something they cache
+    has changed; each notices within ``interval`` seconds when it next
+    calls changed(). Workers on other hosts only see it if the file is
+    on a shared filesystem.
+    """
+
+    def __init__(self, path: str, interval: float = 1.0):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._seen = self._read()
+        self._checked = time.monotonic()
+
+    def _read(self) -> str:
+        try:
+            with open(self.path) as fh:
+                return fh.read()
+        except OSError:
+            return ""
+
+    def bump(self) -> None:
+        """Write a new stamp, which every other worker will see as a change."""
+        stamp = "{0}-{1}".format(time.time_ns(), uuid.uuid4().hex)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        partial = "{0}.{1}".format(self.path, uuid.uuid4().hex)
+        with open(partial, "w") as fh:
+            fh.write(stamp)
+        os.replace(partial, self.path)
+        with self._lock:
+            self._seen = stamp
+
+    def current(self) -> str:
+        """Returns the stamp this worker last read or wrote."""
+        with self._lock:
+            return self._seen
+
+    def changed(self) -> bool:
+        """Returns True if another worker has bumped the stamp since last seen.
+
+        The file is read at most once per interval seconds."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < self.interval:
+                return False
+            self._checked = now
+        stamp = self._read()
+        with self._lock:
+            if stamp == self._seen:
+                return False
+            self._seen = stamp
+            return True
@@ -0,0 +1,172 @@
+"""Long-lived Tapis clients shared across requests"""
+import threading
+import time
+from typing import Dict, Optional
+
+from tapipy.errors import BaseTapyException, NotAuthorizedError, TokenInvalidError
+from tapipy.tapis import Tapis
+
+from .cache import TTLCache, token_key
+
+__all__ = ["ClientPool", "ServiceClient", "is_auth_failure"]
+
+
+def is_auth_failure(exc: Exception) -> bool:
+    """Returns True if a Tapis exception was caused by a rejected token.
+
+    Works for tapipy exceptions and for tapis_async.TapisResponseError.
+    """
+    if isinstance(exc, (NotAuthorizedError, TokenInvalidError)):
+        return True
+    status_code = getattr(exc, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(exc, "response", None), "status_code", None)
+    return status_code in (401, 403)
+
+
+class ServiceClient(object):
+    """A process-wide Tapis client for the configured service account.
+
+    The client is built once, on first use. Its access token is renewed
+    in a background thread refresh_margin seconds before it expires, and
+    the client is rebuilt from scratch after reset() is called, which
+    should happen whenever Tapis rejects its token.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        tenant_id: str,
+        username: str,
+        password: str,
+        refresh_margin: float = 300,
+    ):
+        self.base_url = base_url
+        self.tenant_id = tenant_id
+        self.username = username
+        self.password = password
+        self.refresh_margin = refresh_margin
+        self._client = None
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def _build(self) -> Tapis:
+        client = Tapis(
+            base_url=self.base_url,
+            tenant_id=self.tenant_id,
+            username=self.username,
+            password=self.password,
+        )
+        client.get_tokens()
+        return client
+
+    def _expires_at(self) -> Optional[float]:
+        try:
+            return self._client.access_token.expires_at.timestamp()
+        except AttributeError:
+            return None
+
+    def _schedule_refresh(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        expires_at = self._expires_at()
+        if expires_at is None:
+            return
+        delay = max(expires_at - time.time() - self.refresh_margin, 1.0)
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            # Drop the client; the next request will rebuild it
+            self.reset()
+
+    def refresh(self) -> Tapis:
+        """Renew the service account access token."""
+        with self._lock:
+            if self._client is None:
+                self._client = self._build()
+            elif self._client.refresh_token and self._client.client_id:
+                self._client.refresh_tokens()
+            else:
+                self._client.get_tokens()
+            self._schedule_refresh()
+            return self._client
+
+    def peek(self) -> Optional[Tapis]:
+        """Returns the shared client if it is ready to use, without blocking."""
+        client = self._client
+        if client is None:
+            return None
+        expires_at = self._expires_at()
+        if expires_at is not None and expires_at - time.time() < 5:
+            return None
+        return client
+
+    def get(self) -> Tapis:
+        """Returns the shared client, building or refreshing it if needed."""
+        with self._lock:
+            if self._client is None:
+                return self.refresh()
+            expires_at = self._expires_at()
+            if expires_at is not None and expires_at - time.time() < 5:
+                # The background refresh has fallen behind
+                return self.refresh()
+            return self._client
+
+    def reset(self) -> None:
+        """Discard the shared client so that it is rebuilt on next use."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._client = None
+
+
+class ClientPool(object):
+    """A thread-safe pool of user Tapis clients keyed on a hash of their token.
+
+    Building a Tapis client loads its OpenAPI specs, so clients are kept
+    and reused across requests. The least recently used client is evicted
+    when the pool is full, and clients are dropped after idle_ttl seconds
+    without use or when their token expires.
+    """
+
+    def __init__(
+        self, base_url: str, tenant_id: str, maxsize: int = 128, idle_ttl: float = 600
+    ):
+        self.base_url = base_url
+        self.tenant_id = tenant_id
+        self._cache = TTLCache(maxsize=maxsize, ttl=idle_ttl)
+
+    def _build(self, token: str) -> Tapis:
+        # Passing tenant_id keeps tapipy from listing tenants on construction
+        return Tapis(
+            base_url=self.base_url, tenant_id=self.tenant_id, access_token=token
+        )
+
+    def get(self, token: str) -> Tapis:
+        """Returns a client for token, building one if none is pooled."""
+        key = token_key(token)
+        entry = self._cache.get(key)
+        if entry is None:
+            client = self._build(token)
+            try:
+                expires_at = client.access_token.expires_at.timestamp()
+            except AttributeError:
+                expires_at = None
+        else:
+            client, expires_at = entry
+        # Re-inserting slides the idle window, still capped at token expiry
+        self._cache.set(key, (client, expires_at), expires_at=expires_at)
+        return client
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict:
+        return self._cache.stats()
@@ -17,17 +17,49 @@ class Settings(BaseSettings):
     tapis_client_scope: str = "PRODUCTION"
     tapis_service_uname: str = "username"
     tapis_service_pass: str = "p@assw0rd!"
-    tapis_client_id: str = "client_id"
-    tapis_client_key: str = "client_key"
+    tapis_service_refresh_margin: int = 300
+    tapis_client_id: str = ""
+    tapis_client_key: str = ""
     tapis_client_secret: str = "client_secret"
+    tapis_jwt_verify_local: bool = False
+    tapis_jwt_public_key_path: str = ""
+    tapis_jwt_key_refresh: int = 3600
     app_secret_key: str = "A>=MW;ZDF;/;Nf5>fNWnBPv@"
     app_otp_key: str = "Wx9H2K9fJzmnMKKquGca76ALdY8MaaMp"
     app_public_cname: str = "localhost"
     app_log_level: str = "DEBUG"
     app_debug: bool = False
     app_default_page_size: int = 50
+    app_export_page_size: int = 1000
+    app_batch_max_items: int = 1000
+    app_batch_query_size: int = 100
+    app_batch_concurrency: int = 8
     app_log_path: str = "."
     app_build_version: str = ""
+    app_role_cache_size: int = 1024
+    app_role_cache_ttl: int = 60
+    app_reference_cache_size: int = 512
+    app_reference_cache_ttl: int = 300
+    app_reject_cache_ttl: int = 5
+    app_reject_cache_max_ttl: int = 300
+    app_client_pool_size: int = 128
+    app_client_pool_idle: int = 600
+    app_async_auth: bool = False
+    app_http_pool_size: int = 100
+    app_http_timeout: float = 10.0
+    app_audit_queue_size: int = 10000
+    # "drop" loses records when the queue is full; "block" makes the request
+    # being logged wait (in the threadpool) for up to a second first
+    app_audit_queue_policy: str = "drop"
+    app_audit_batch_size: int = 100
+    app_audit_body_max_bytes: int = 65536
+    app_audit_segments: bool = True
+    app_audit_segment_interval: int = 3600
+    app_metrics_path: str = ""
+    app_metrics_interval: float = 10.0
+    app_slow_request_ms: int = 1000
+    app_profile_interval_ms: float = 5.0
+    app_profile_max_seconds: float = 60.0
 
     class Config:
         env_file = "env.rc"
@@ -1,23 +1,95 @@
 """Provides common dependencies for FastAPI routes"""
+import asyncio
+import functools
+import hashlib
 import json
 import jwt
+import os
+import time
 from datetime import datetime
 from functools import lru_cache
-from typing import Callable, List, Optional
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional
 
+import httpx
 import vbr
 from fastapi import Depends, Header, HTTPException, Request, Response, status
 from fastapi.routing import APIRoute
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
 from tapipy.errors import BaseTapyException
 from tapipy.tapis import Tapis
 from vbr.hashable import picklecache
 
-from .auditlog import logger
+from .auditlog import (
+    audited_stream,
+    dumps_with_fragments,
+    json_fragment,
+    logger,
+    slow_logger,
+    write_audit,
+)
+from .cache import SharedGeneration, TTLCache, token_key
+from .clients import ClientPool, ServiceClient, is_auth_failure
 from .config import get_settings
+from . import tapis_async
+from .profiler import profiled_thread, save_profile, start_profiling
+from .roles import hierarchy
+from .timing import add_span, server_timing, span, start_spans
+from .tokens import KeyUnavailable, verify_token, verify_token_async
+from .upstream import InstrumentedProxy, start_trace, upstream_call
 
 settings = get_settings()
 
+# Service account client, shared by all requests handled by this worker
+service_client = ServiceClient(
+    base_url=settings.tapis_base_url,
+    tenant_id=settings.tapis_tenant_id,
+    username=settings.tapis_service_uname,
+    password=settings.tapis_service_pass,
+    refresh_margin=settings.tapis_service_refresh_margin,
+)
+
+# User clients, reused across requests that present the same token
+client_pool = ClientPool(
+    base_url=settings.tapis_base_url,
+    tenant_id=settings.tapis_tenant_id,
+    maxsize=settings.app_client_pool_size,
+    idle_ttl=settings.app_client_pool_idle,
+)
+
+# Resolved username and claims, keyed on a hash of the caller's token
+identity_cache = TTLCache(
+    maxsize=settings.app_role_cache_size, ttl=settings.app_role_cache_ttl
+)
+
+# Recently rejected tokens, keyed on a hash of the token
+rejected_tokens = TTLCache(
+    maxsize=settings.app_role_cache_size, ttl=settings.app_reject_cache_max_ttl
+)
+
+# Effective roles, keyed on username
+role_cache = TTLCache(
+    maxsize=settings.app_role_cache_size, ttl=settings.app_role_cache_ttl
+)
+
+# Bumped whenever roles are invalidated, so that every worker drops its
+# cached roles, not just the one that handled the change
+role_generation = SharedGeneration(
+    os.path.join(settings.app_log_path, "cache", "roles.generation")
+)
+
+# Rows of the reference-data views (units, container types and so on),
+# keyed on generation, view name and query
+reference_cache = TTLCache(
+    maxsize=settings.app_reference_cache_size, ttl=settings.app_reference_cache_ttl
+)
+
+# Bumped whenever reference data is written, so that every worker stops
+# serving the rows it cached before the write
+reference_generation = SharedGeneration(
+    os.path.join(settings.app_log_path, "cache", "reference.generation")
+)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 
@@ -26,34 +98,49 @@ async def limit_offset(offset: int = 0, limit: int = settings.app_default_page_s
     return {"offset": offset, "limit": limit}
 
 
-# @picklecache.mcache(lru_cache(maxsize=32))
+async def limit_offset_cursor(
+    offset: int = 0,
+    limit: int = settings.app_default_page_size,
+    cursor: Optional[str] = None,
+):
+    """Provides limit and offset query parameters, plus a keyset cursor.
+
+    Pass the X-Next-Cursor header of one page as cursor to get the next.
+    """
+    return {"offset": offset, "limit": limit, "cursor": cursor}
+
+
 def _client(token: str) -> Tapis:
     """Private: Returns a Tapis client given an Oauth token.
 
-    This is wrapped in an LRU cache to avoid having to load Tapis
-    library multiple times when the same token is provided as input.
+    Clients are pooled to avoid having to load Tapis library
+    multiple times when the same token is provided as input.
     """
-    return Tapis(base_url=settings.tapis_base_url, access_token=token)
+    return client_pool.get(token)
 
 
-# @picklecache.mcache(lru_cache(maxsize=4))
 def tapis_admin_client() -> Tapis:
     """Returns the configured service account Tapis client
 
-    This account must have the PGREST_ADMIN role."""
-    client = Tapis(
-        base_url=settings.tapis_base_url,
-        username=settings.tapis_service_uname,
-        password=settings.tapis_service_pass,
-    )
-    client.get_tokens()
-    return client
+    This account must have the PGREST_ADMIN role. The client is built once
+    per worker and its token is refreshed in the background.
+    """
+    return service_client.get()
 
 
 def vbr_admin_client(client: Tapis = Depends(tapis_admin_client)):
     """Returns a VBR client that uses the configured Tapis service account"""
-    vbr_client = vbr.api.get_vbr_api_client(client)
-    return vbr_client
+    # Calls made through the proxy are counted and timed
+    vbr_client = InstrumentedProxy(
+        vbr.api.get_vbr_api_client(client), nested=("vbr_client",)
+    )
+    try:
+        yield vbr_client
+    except BaseTapyException as exc:
+        # Rebuild the service client if Tapis has stopped accepting its token
+        if is_auth_failure(exc):
+            service_client.reset()
+        raise
 
 
 async def tapis_token(x_tapis_token: str = Depends(oauth2_scheme)):
@@ -61,44 +148,343 @@ async def tapis_token(x_tapis_token: str = Depends(oauth2_scheme)):
     return x_tapis_token
 
 
-def tapis_client(x_tapis_token: str = Depends(tapis_token)) -> Tapis:
-    """Returns a user Tapis client for the provided token"""
+class TapisIdentity(NamedTuple):
+    username: str
+    claims: Dict
+
+
+class Rejection(NamedTuple):
+    strikes: int
+    reason: str
+    retry_at: float
+
+
+class AuthContext(NamedTuple):
+    """The resolved caller for a request"""
+
+    token: str
+    username: str
+    roles: FrozenSet[str]
+    claims: Dict
+
+
+def _token_claims(token: str) -> Dict:
+    """Private: Returns the claims of a token without verifying it."""
     try:
-        client = _client(x_tapis_token)
-    except BaseTapyException as exc:
+        return jwt.decode(token, options={"verify_signature": False})
+    except jwt.exceptions.DecodeError:
+        return {}
+
+
+def _reject(key: str, reason) -> None:
+    """Private: Remember that a token was rejected, then raise a 401.
+
+    Each further rejection of the same token doubles how long it is
+    refused from cache, up to app_reject_cache_max_ttl seconds.
+    """
+    now = time.time()
+    previous = rejected_tokens.get(key)
+    strikes = 1 if previous is None else previous.strikes + 1
+    backoff = min(
+        settings.app_reject_cache_ttl * 2 ** (strikes - 1),
+        settings.app_reject_cache_max_ttl,
+    )
+    rejection = Rejection(strikes=strikes, reason=str(reason), retry_at=now + backoff)
+    rejected_tokens.set(key, rejection)
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Token was not valid: {0}".format(reason),
+    )
+
+
+def upstream_error(exc: Exception, action: str = "verify token") -> HTTPException:
+    """Returns the error for a Tapis failure that was not the caller's.
+
+    An unreachable or overloaded Tapis is a 503. An error status, or a
+    reply that cannot be read, is a 502. These are not cached, so the
+    next request tries Tapis again.
+    """
+    status_code = getattr(exc, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(exc, (KeyError, TypeError, ValueError)):
+        # Tapis answered, but not with what was asked for
+        status_code = status.HTTP_502_BAD_GATEWAY
+    elif status_code in (None, 429, 503, 504):
+        # Tapis is down, overloaded or unreachable
+        status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    else:
+        status_code = status.HTTP_502_BAD_GATEWAY
+    return HTTPException(
+        status_code=status_code,
+        detail="Unable to {0} with Tapis: {1}".format(action, exc),
+    )
+
+
+def _precheck(key: str, token: str) -> Dict:
+    """Private: Fail fast, without calling Tapis, on tokens that are known bad.
+
+    Returns the unverified token claims.
+    """
+    rejection = rejected_tokens.get(key)
+    if rejection is not None and rejection.retry_at > time.time():
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token was not valid: {0}".format(exc),
+            detail="Token was not valid: {0}".format(rejection.reason),
         )
-    return client
+    claims = _token_claims(token)
+    exp = claims.get("exp", None)
+    if exp is not None and exp <= time.time():
+        _reject(key, "Token has expired")
+    return claims
 
 
-def tapis_user(token: str = Depends(tapis_token)):
-    """Get Tapis user profile for the provided token."""
+def _local_identity(key: str, token: str) -> TapisIdentity:
+    """Private: Verify a token against the tenant public key.
+
+    This avoids asking the Tapis authenticator who the token belongs to.
+    """
     try:
-        t = _client(token)
-    except BaseTapyException as exc:
+        claims = verify_token(token)
+        return TapisIdentity(username=claims["tapis/username"], claims=claims)
+    except (jwt.exceptions.InvalidTokenError, KeyError) as exc:
+        _reject(key, exc)
+    except KeyUnavailable as exc:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token was not valid: {0}".format(exc),
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc)
+        )
+
+
+async def _local_identity_async(key: str, token: str) -> TapisIdentity:
+    """Private: Non-blocking version of _local_identity."""
+    try:
+        claims = await verify_token_async(token)
+        return TapisIdentity(username=claims["tapis/username"], claims=claims)
+    except (jwt.exceptions.InvalidTokenError, KeyError) as exc:
+        _reject(key, exc)
+    except KeyUnavailable as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc)
         )
-    return t.authenticator.get_userinfo().username
 
 
-def tapis_roles(user: str = Depends(tapis_user), token: str = Depends(tapis_token)):
-    """Get Tapis SK roles for the provided user."""
+def resolve_identity(token: str) -> TapisIdentity:
+    """Resolve the Tapis username and claims for a token.
+
+    Results are cached on a hash of the token until the token expires
+    or app_role_cache_ttl elapses, whichever comes first. Expired and
+    recently rejected tokens are refused without calling Tapis.
+    """
+    key = token_key(token)
+    identity = identity_cache.get(key)
+    if identity is not None:
+        return identity
+    claims = _precheck(key, token)
+    if settings.tapis_jwt_verify_local:
+        identity = _local_identity(key, token)
+    else:
+        try:
+            t = _client(token)
+            with upstream_call("oauth2.get_userinfo"):
+                username = t.authenticator.get_userinfo().username
+        except BaseTapyException as exc:
+            if is_auth_failure(exc):
+                _reject(key, exc)
+            raise upstream_error(exc)
+        identity = TapisIdentity(username=username, claims=claims)
+    identity_cache.set(key, identity, expires_at=identity.claims.get("exp", None))
+    return identity
+
+
+async def resolve_identity_async(token: str) -> TapisIdentity:
+    """Non-blocking version of resolve_identity."""
+    key = token_key(token)
+    identity = identity_cache.get(key)
+    if identity is not None:
+        return identity
+    claims = _precheck(key, token)
+    if settings.tapis_jwt_verify_local:
+        identity = await _local_identity_async(key, token)
+    else:
+        try:
+            with upstream_call("oauth2.get_userinfo"):
+                username = await tapis_async.get_username(token)
+        except tapis_async.TapisResponseError as exc:
+            if is_auth_failure(exc):
+                _reject(key, exc)
+            raise upstream_error(exc)
+        except httpx.HTTPError as exc:
+            raise upstream_error(exc)
+        identity = TapisIdentity(username=username, claims=claims)
+    identity_cache.set(key, identity, expires_at=identity.claims.get("exp", None))
+    return identity
+
+
+def _sync_role_cache() -> None:
+    """Private: Drop all cached roles if another worker invalidated any."""
+    if role_generation.changed():
+        role_cache.clear()
+
+
+def effective_roles(username: str, client: Tapis = None) -> FrozenSet[str]:
+    """Returns the effective roles for a user.
+
+    Roles are fetched from SK once per user, using client or else the
+    service account, and expanded through the role hierarchy in roles.py.
+    The result is cached for app_role_cache_ttl seconds.
+    """
+    _sync_role_cache()
+    roles = role_cache.get(username)
+    if roles is None:
+        if client is None:
+            client = service_client.get()
+        with upstream_call("sk.getUserRoles", user=username):
+            granted = client.sk.getUserRoles(
+                user=username, tenant=settings.tapis_tenant_id
+            ).names
+        roles = hierarchy.closure(granted)
+        role_cache.set(username, roles)
+    return roles
+
+
+async def effective_roles_async(username: str) -> FrozenSet[str]:
+    """Non-blocking version of effective_roles."""
+    _sync_role_cache()
+    roles = role_cache.get(username)
+    if roles is None:
+        client = service_client.peek()
+        if client is None:
+            # Building or renewing the service client still blocks
+            client = await run_in_threadpool(service_client.get)
+        with upstream_call("sk.getUserRoles", user=username):
+            granted = await tapis_async.get_user_roles(
+                username, client.access_token.access_token
+            )
+        roles = hierarchy.closure(granted)
+        role_cache.set(username, roles)
+    return roles
+
+
+def invalidate_user_roles(username: str) -> int:
+    """Drop cached roles for a user, returning the number of entries removed.
+
+    Call this after granting or revoking roles so that changes are
+    visible before cached entries expire. Other workers drop all of their
+    cached roles within a second of the call."""
+    role_generation.bump()
+    if role_cache.pop(username) is None:
+        return 0
+    return 1
+
+
+def _reference_generation() -> str:
+    """Private: Returns the reference-data generation, dropping stale rows."""
+    if reference_generation.changed():
+        reference_cache.clear()
+    return reference_generation.current()
+
+
+def cached_view_rows(
+    client: vbr.api.VBR_Api, view_name: str, query: Dict, limit: int, offset: int
+) -> List[Dict]:
+    """Query a reference-data view through reference_cache.
+
+    Only for small views whose tables rarely change. Writes to those
+    tables must call invalidate_reference_data. Rows are cached under
+    the generation current when the query started, so rows read while
+    another request was writing are never served after its invalidation.
+    Copies of the cached rows are returned, so callers may transform them
+    in place.
+    """
+    key = (
+        _reference_generation(),
+        view_name,
+        json.dumps(query, sort_keys=True),
+        limit,
+        offset,
+    )
+    rows = reference_cache.get(key)
+    if rows is None:
+        rows = client.vbr_client.query_view_rows(
+            view_name=view_name, query=query, limit=limit, offset=offset
+        )
+        reference_cache.set(key, rows)
+    return [dict(row) for row in rows]
+
+
+def invalidate_reference_data() -> int:
+    """Drop all cached reference-data rows, returning the number removed.
+
+    Call this after writing any reference table. Other workers sharing
+    APP_LOG_PATH drop their cached rows within a second of the call."""
+    reference_generation.bump()
+    removed = len(reference_cache)
+    reference_cache.clear()
+    return removed
+
+
+def _resolve_context(token: str) -> AuthContext:
+    """Private: Resolve the caller using blocking Tapis calls."""
+    identity = resolve_identity(token)
+    return AuthContext(
+        token=token,
+        username=identity.username,
+        roles=effective_roles(identity.username),
+        claims=identity.claims,
+    )
+
+
+async def auth_context(
+    request: Request, token: str = Depends(tapis_token)
+) -> AuthContext:
+    """Resolve the caller once per request.
+
+    The result is attached to request.state.auth, where the role guards
+    and LoggingRoute read it. With app_async_auth enabled, Tapis is
+    called without occupying a worker thread.
+    """
+    context = getattr(request.state, "auth", None)
+    if context is not None and context.token == token:
+        return context
+    with span("auth"):
+        if settings.app_async_auth:
+            identity = await resolve_identity_async(token)
+            context = AuthContext(
+                token=token,
+                username=identity.username,
+                roles=await effective_roles_async(identity.username),
+                claims=identity.claims,
+            )
+        else:
+            context = await run_in_threadpool(_resolve_context, token)
+    request.state.auth = context
+    return context
+
+
+def tapis_client(auth: AuthContext = Depends(auth_context)) -> Tapis:
+    """Returns a user Tapis client for the provided token"""
     try:
-        t = _client(token)
+        client = _client(auth.token)
     except BaseTapyException as exc:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token was not valid: {0}".format(exc),
         )
-    return t.sk.getUserRoles(user=user, tenant=settings.tapis_tenant_id).names
+    return client
+
+
+async def tapis_user(auth: AuthContext = Depends(auth_context)):
+    """Get Tapis username for the provided token."""
+    return auth.username
+
+
+async def tapis_roles(auth: AuthContext = Depends(auth_context)):
+    """Get Tapis SK roles for the provided token."""
+    return auth.roles
 
 
-def role_pgrest_admin(roles: List[str] = Depends(tapis_roles)):
-    if not "PGREST_ADMIN" in roles:
+async def role_pgrest_admin(auth: AuthContext = Depends(auth_context)):
+    if not "PGREST_ADMIN" in auth.roles:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
 
@@ -107,41 +493,193 @@ def role_pgrest_admin(roles: List[str] = Depends(tapis_roles)):
 # See ../scripts/create_roles.py for details
 
 
-def vbr_user(roles: List[str] = Depends(tapis_roles)):
-    if not "VBR_USER" in roles:
+async def vbr_user(auth: AuthContext = Depends(auth_context)):
+    if not "VBR_USER" in auth.roles:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
 
-def vbr_admin(roles: List[str] = Depends(tapis_roles)):
-    if not "VBR_ADMIN" in roles:
+async def vbr_admin(auth: AuthContext = Depends(auth_context)):
+    if not "VBR_ADMIN" in auth.roles:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
 
-def vbr_read_public(roles: List[str] = Depends(tapis_roles)):
-    if not "VBR_READ_PUBLIC" in roles:
+async def vbr_read_public(auth: AuthContext = Depends(auth_context)):
+    if not "VBR_READ_PUBLIC" in auth.roles:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
 
-def vbr_read_limited_phi(roles: List[str] = Depends(tapis_roles)):
-    if not "VBR_READ_LIMITED_PHI" in roles:
+async def vbr_read_limited_phi(
+    request: Request, auth: AuthContext = Depends(auth_context)
+):
+    if not "VBR_READ_LIMITED_PHI" in auth.roles:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    mark_phi(request)
 
 
-def vbr_read_any_phi(roles: List[str] = Depends(tapis_roles)):
-    if not "VBR_READ_ANY_PHI" in roles:
+async def vbr_read_any_phi(request: Request, auth: AuthContext = Depends(auth_context)):
+    if not "VBR_READ_ANY_PHI" in auth.roles:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    mark_phi(request)
 
 
-def vbr_write_public(roles: List[str] = Depends(tapis_roles)):
-    if not "VBR_WRITE_PUBLIC" in roles:
+async def vbr_write_public(auth: AuthContext = Depends(auth_context)):
+    if not "VBR_WRITE_PUBLIC" in auth.roles:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
 
-def vbr_write_any(roles: List[str] = Depends(tapis_roles)):
-    if not "VBR_WRITE_ANY" in roles:
+async def vbr_write_any(auth: AuthContext = Depends(auth_context)):
+    if not "VBR_WRITE_ANY" in auth.roles:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
 
+def _timed_endpoint(call: Callable) -> Callable:
+    """Private: Wrap a route endpoint so its run time is an "endpoint" span."""
+    if getattr(call, "_timed", False):
+        return call
+    if asyncio.iscoroutinefunction(call):
+
+        @functools.wraps(call)
+        async def timed(*args, **kwargs):
+            with span("endpoint"):
+                return await call(*args, **kwargs)
+
+    else:
+
+        @functools.wraps(call)
+        def timed(*args, **kwargs):
+            # Sync endpoints run in a worker thread, which is sampled too
+            # when the request is being profiled
+            with span("endpoint"), profiled_thread():
+                return call(*args, **kwargs)
+
+    timed._timed = True
+    return timed
+
+
+async def _start_profiler(request: Request):
+    """Private: Start a profiler if a VBR_ADMIN asked for one.
+
+    Profiling is requested with an X-VBR-Profile header or a profile
+    query parameter. The caller is resolved here, before the route runs,
+    so the role check does not depend on the route's own guards. The
+    flag is ignored for anyone else.
+    """
+    flag = request.headers.get("x-vbr-profile") or request.query_params.get(
+        "profile"
+    )
+    if flag is None or flag.lower() not in ("1", "true", "yes"):
+        return None
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        auth = await auth_context(request, token)
+    except HTTPException:
+        return None
+    if "VBR_ADMIN" not in auth.roles:
+        return None
+    return start_profiling()
+
+
+DEFAULT_CACHE_CONTROL = "private, no-cache"
+
+# Responses containing PHI are never stored, even by the caller's own cache
+PHI_CACHE_CONTROL = "no-store"
+
+
+def cache_control(value: str) -> Callable:
+    """Returns a dependency that sets the Cache-Control of GET responses.
+
+    Add it to a router's dependencies to set a policy for all of its
+    routes, or to a single route to override the router's. Responses
+    marked with mark_phi always get PHI_CACHE_CONTROL instead.
+    """
+
+    async def set_cache_control(request: Request):
+        request.state.cache_control = value
+
+    return set_cache_control
+
+
+def mark_phi(request: Request) -> None:
+    """Send the response to request with PHI_CACHE_CONTROL.
+
+    The PHI role guards call this, so routes that depend on them are
+    covered. Routes that return PHI only to some callers must call it
+    themselves when they do."""
+    request.state.phi = True
+
+
+# Reference data (units, container types, locations and so on) changes
+# rarely, so clients may reuse it for a minute without revalidating
+REFERENCE_CACHE_CONTROL = Depends(cache_control("private, max-age=60"))
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Private: Weak comparison of an If-None-Match header to an ETag."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.replace("W/", "", 1) == etag:
+            return True
+    return False
+
+
+def _apply_cache_policy(request: Request, response: Response) -> Response:
+    """Private: Add ETag and caching headers to a successful GET response.
+
+    The strong ETag is a hash of the serialized body. If the request's
+    If-None-Match already names it, a bodiless 304 is returned instead.
+    """
+    if request.method not in ("GET", "HEAD") or response.status_code != 200:
+        return response
+    cache_policy = getattr(request.state, "cache_control", DEFAULT_CACHE_CONTROL)
+    if getattr(request.state, "phi", False):
+        cache_policy = PHI_CACHE_CONTROL
+    headers = {"Cache-Control": cache_policy, "Vary": "Authorization"}
+    body = getattr(response, "body", None)
+    if body is not None and not hasattr(response, "body_iterator"):
+        headers["ETag"] = '"{0}"'.format(hashlib.sha256(body).hexdigest()[:32])
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return response
+
+
+async def _log_if_slow(log: Dict, response: Response, trace) -> None:
+    """Private: Write the upstream call trace of a slow request to slow.log."""
+    elapsed = time.perf_counter() - trace.start
+    if elapsed * 1000 < settings.app_slow_request_ms:
+        return
+    record = {
+        "timestamp": log["timestamp"],
+        "id": log["id"],
+        "operation_id": log["operation_id"],
+        "method": log["request"]["method"],
+        "url": log["request"]["url"],
+        "status_code": response.status_code,
+        "duration_ms": round(1000 * elapsed, 3),
+        "timing": log["timing"],
+        "calls": trace,
+        "calls_dropped": trace.dropped,
+    }
+    await write_audit(
+        slow_logger, json.dumps(record, separators=(",", ":"), default=str)
+    )
+
+
+def _parsed_json_body(request: Request, response: Response, body_field) -> bool:
+    """Private: Returns True if the route parsed the request body as JSON.
+
+    Routes without a body model accept any payload, so a successful
+    response alone does not mean the body was valid JSON.
+    """
+    if body_field is None or response.status_code >= 400:
+        return False
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    return content_type == "application/json" or content_type.endswith("+json")
+
+
 def timestamp():
     """Return formatted UTC timestamp"""
     DEST = "%Y-%m-%dT%H:%M:%S.%fZ"
@@ -151,10 +689,18 @@ def timestamp():
 class LoggingRoute(APIRoute):  # noqa
     """Log request and response as JSON using the audit logger"""
 
+    def __init__(self, path: str, endpoint: Callable, **kwargs) -> None:
+        # Time the endpoint itself, apart from dependencies and serialization.
+        # The wrapper must be in place before APIRoute builds the dependant,
+        # which is copied when the route is included in an app.
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
     def get_route_handler(self) -> Callable:  # noqa
         original_route_handler = super().get_route_handler()
 
         async def custom_route_handler(request: Request) -> Response:  # noqa
+            spans = start_spans()
+            trace = start_trace()
 
             log = {
                 "timestamp": timestamp(),
@@ -166,48 +712,103 @@ class LoggingRoute(APIRoute):  # noqa
             scope = request.scope
             log["operation_id"] = scope.get("endpoint").__name__
 
-            headers = dict(request.headers)
-            auth_header = headers.pop("authorization", "")
-            auth_header = auth_header.replace("Bearer ", "")
-
-            try:
-                jwt_claimset = jwt.decode(
-                    auth_header, options={"verify_signature": False}
-                )
-                tapis_username = jwt_claimset.get("tapis/username", None)
-                # TODO - caching
-                # if tapis_username is not None:
-                #     admin_client = tapis_admin_client()
-                #     tapis_roles = admin_client.sk.getUserRoles(
-                #         user=tapis_username, tenant=settings.tapis_tenant_id
-                #     ).names
-            except jwt.exceptions.DecodeError:
-                jwt_claimset = {}
-                # tapis_roles = []
-
             log["request"]["method"] = str(request.method)
             log["request"]["url"] = str(request.url)
-            log["request"]["jwt_claimset"] = jwt_claimset
+            log["request"]["jwt_claimset"] = {}
+            log["request"]["tapis_roles"] = []
             log["request"]["query_params"] = dict(request.query_params)
             log["request"]["path_params"] = dict(request.path_params)
 
+            # Bodies are spliced into the record as raw JSON rather than
+            # parsed here and serialized again
+            fragments = {}
             if scope.get("method", None) in ("POST", "PUT", "PATCH"):
-                request_json = await request.json()
+                request_body = await request.body()
             else:
-                request_json = None
-            log["request"]["body"] = request_json
+                request_body = None
+            log["request"]["body"] = "@request_body:" + request.state.uuid
+
+            profiler = await _start_profiler(request)
+            try:
+                response = await original_route_handler(request)
+            finally:
+                if profiler is not None:
+                    profiler.stop()
+            if profiler is not None:
+                save_profile(request.state.uuid, profiler)
+                response.headers["X-VBR-Profile-Id"] = request.state.uuid
+
+            # Everything after the endpoint returned is response validation
+            # and serialization
+            if "endpoint" in spans.ended:
+                add_span("serialize", time.perf_counter() - spans.ended["endpoint"])
+            response = _apply_cache_policy(request, response)
+            if spans:
+                response.headers["Server-Timing"] = server_timing(spans)
+            log["timing"] = {
+                name: round(1000 * seconds, 3) for name, (seconds, _) in spans.items()
+            }
+            await _log_if_slow(log, response, trace)
+
+            # Identity was resolved by the route's auth dependencies, if any
+            auth = getattr(request.state, "auth", None)
+            if auth is not None:
+                log["request"]["jwt_claimset"] = auth.claims
+                log["request"]["tapis_roles"] = sorted(auth.roles)
+            else:
+                auth_header = request.headers.get("authorization", "")
+                log["request"]["jwt_claimset"] = _token_claims(
+                    auth_header.replace("Bearer ", "")
+                )
 
-            response = await original_route_handler(request)
             log["response"]["status_code"] = response.status_code
             log["response"]["headers"] = dict(response.headers)
 
-            if scope.get("method", None) in ("POST", "PUT", "PATCH"):
-                response_body = json.loads(response.body)
+            # Indexed by the segmented audit store without reparsing the record
+            index_fields = {
+                "operation_id": log["operation_id"],
+                "username": log["request"]["jwt_claimset"].get("tapis/username"),
+                "status_code": response.status_code,
+                "method": log["request"]["method"],
+                "resources": [str(v) for v in request.path_params.values()],
+            }
+
+            fragments[log["request"]["body"]] = json_fragment(
+                request_body,
+                is_json=_parsed_json_body(request, response, self.body_field),
+            )
+            if hasattr(response, "body_iterator"):
+                # Streamed bodies are summarized, and the record is written
+                # once the last chunk has been sent
+
+                async def finish(summary: Dict) -> None:
+                    log["response"]["response_body"] = summary
+                    await write_audit(
+                        logger,
+                        dumps_with_fragments(log, fragments),
+                        extra={"audit": index_fields},
+                    )
+
+                response.body_iterator = audited_stream(
+                    response.body_iterator, finish
+                )
+                return response
+            elif not hasattr(response, "body"):
+                log["response"]["response_body"] = {"note": "not logged"}
+            elif scope.get("method", None) in ("POST", "PUT", "PATCH"):
+                placeholder = "@response_body:" + request.state.uuid
+                log["response"]["response_body"] = placeholder
+                fragments[placeholder] = json_fragment(
+                    response.body, is_json=response.media_type == "application/json"
+                )
             else:
-                response_body = {"note": "not logged"}
-            log["response"]["response_body"] = response_body
+                log["response"]["response_body"] = {"note": "not logged"}
 
-            logger.info(json.dumps(log, separators=(",", ":")))
+            await write_audit(
+                logger,
+                dumps_with_fragments(log, fragments),
+                extra={"audit": index_fields},
+            )
             return response
 
         return custom_route_handler
@@ -1,13 +1,19 @@
 """Administrative routes"""
 from datetime import datetime
 from enum import Enum
+from typing import Dict, List
 
 from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, EmailStr
 from tapipy.tapis import Tapis
 
+from ..auditlog import audit_directory, audit_stats
+from ..auditstore import query_segments
 from ..config import get_settings
+from ..profiler import list_profiles, load_profile
 from ..dependencies import *
+from ..routers.models import GenericResponse
 
 settings = get_settings()
 
@@ -139,6 +145,7 @@ def add_user(body: AddUser = Body(...), client: Tapis = Depends(tapis_client)):
             user=body.username,
             roleName=body.role.value,
         )
+        invalidate_user_roles(body.username)
         return build_user(username=body.username, client=client)
     except Exception:
         raise
@@ -151,10 +158,7 @@ def add_user(body: AddUser = Body(...), client: Tapis = Depends(tapis_client)):
 )
 def get_user(username: str, client: Tapis = Depends(tapis_client)):
     """Get profile of an authorized user."""
-    if (
-        "VBR_USER"
-        in client.sk.getUserRoles(user=username, tenant=settings.tapis_tenant_id).names
-    ):
+    if "VBR_USER" in effective_roles(username, client):
         user_profile = build_user(username, client)
         return User(**user_profile)
     else:
@@ -169,11 +173,7 @@ def get_user(username: str, client: Tapis = Depends(tapis_client)):
 def list_user_roles(username: str, client: Tapis = Depends(tapis_client)):
     """List roles for an authorized user."""
     roles = [
-        r
-        for r in client.sk.getUserRoles(
-            tenant=settings.tapis_tenant_id, user=username
-        ).names
-        if r in [e.value for e in Role]
+        r for r in effective_roles(username, client) if r in [e.value for e in Role]
     ]
     roles = sorted(roles)
     return roles
@@ -193,13 +193,10 @@ def grant_user_role(
     client.sk.grantRole(
         tenant=settings.tapis_tenant_id, user=username, roleName=role.value
     )
+    invalidate_user_roles(username)
     # Return list of roles for user
     roles = [
-        r
-        for r in client.sk.getUserRoles(
-            tenant=settings.tapis_tenant_id, user=username
-        ).names
-        if r in [e.value for e in Role]
+        r for r in effective_roles(username, client) if r in [e.value for e in Role]
     ]
     roles = sorted(roles)
     return roles
@@ -218,12 +215,114 @@ def revoke_user_role(username: str, role: Role, client: Tapis = Depends(tapis_cl
     client.sk.revokeUserRole(
         tenant=settings.tapis_tenant_id, user=username, roleName=role.value
     )
+    invalidate_user_roles(username)
     roles = [
-        r
-        for r in client.sk.getUserRoles(
-            tenant=settings.tapis_tenant_id, user=username
-        ).names
-        if r in [e.value for e in Role]
+        r for r in effective_roles(username, client) if r in [e.value for e in Role]
     ]
     roles = sorted(roles)
     return roles
+
+
+@router.delete(
+    "/user/{username}/cache",
+    dependencies=[Depends(vbr_admin)],
+    response_model=GenericResponse,
+)
+def flush_user_cache(username: str):
+    """Flush cached roles for a user.
+
+    Roles are cached briefly to avoid calling Tapis SK on every request.
+    Use this to make out-of-band role changes take effect immediately.
+    Every worker sharing APP_LOG_PATH drops its cached roles within a
+    second; workers elsewhere keep them for up to APP_ROLE_CACHE_TTL.
+    """
+    removed = invalidate_user_roles(username)
+    return {
+        "message": "Cache flushed",
+        "details": "{0} cached entries removed".format(removed),
+    }
+
+
+@router.delete(
+    "/reference/cache",
+    dependencies=[Depends(vbr_admin)],
+    response_model=GenericResponse,
+)
+def flush_reference_cache():
+    """Flush cached reference data.
+
+    Units, locations, organizations, projects and other reference views
+    are cached briefly. Routes that write them flush the cache already;
+    use this after changing reference tables outside the API. Every
+    worker sharing APP_LOG_PATH drops its cached rows within a second.
+    """
+    removed = invalidate_reference_data()
+    return {
+        "message": "Cache flushed",
+        "details": "{0} cached entries removed".format(removed),
+    }
+
+
+@router.get("/stats", dependencies=[Depends(vbr_admin)], response_model=Dict)
+def get_stats():
+    """Get runtime statistics for in-process caches and the audit queue."""
+    return {
+        "identity_cache": identity_cache.stats(),
+        "rejected_tokens": rejected_tokens.stats(),
+        "role_cache": role_cache.stats(),
+        "client_pool": client_pool.stats(),
+        "reference_cache": reference_cache.stats(),
+        "audit": audit_stats(),
+    }
+
+
+@router.get("/audit", dependencies=[Depends(vbr_admin)], response_model=List[Dict])
+def query_audit_log(
+    username: Optional[str] = None,
+    operation_id: Optional[str] = None,
+    status_code: Optional[int] = None,
+    resource: Optional[str] = None,
+    writes_only: bool = False,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 100,
+):
+    """Query the audit log.
+
+    resource matches any path parameter value, such as a biospecimen ID.
+    Only segments whose index can contain matches are read.
+    """
+    return query_segments(
+        audit_directory,
+        operation_id=operation_id,
+        username=username,
+        status_code=status_code,
+        resource=resource,
+        writes_only=writes_only,
+        since=since,
+        until=until,
+        limit=limit,
+    )
+
+
+@router.get("/profiles", dependencies=[Depends(vbr_admin)], response_model=List[Dict])
+def list_request_profiles():
+    """List saved request profiles.
+
+    Send X-VBR-Profile: 1 (or ?profile=1) with any request to profile it.
+    Its profile ID is returned in the X-VBR-Profile-Id response header.
+    """
+    return list_profiles()
+
+
+@router.get(
+    "/profiles/{profile_id}",
+    dependencies=[Depends(vbr_admin)],
+    response_class=PlainTextResponse,
+)
+def get_request_profile(profile_id: str):
+    """Get a request profile in folded-stack (flame graph) format."""
+    profile = load_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile)
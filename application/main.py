@@ -11,12 +11,15 @@ except ImportError:  # for Python<3.8
 
 from fastapi import FastAPI, Request
 from pydantic import BaseModel
-from starlette.responses import FileResponse
+from starlette.responses import FileResponse, PlainTextResponse
 
-from .auditlog import logger
+from .auditlog import logger, start_audit_listener, stop_audit_listener
 from .config import get_settings
 from .dependencies import *
 from .internal import admin, auth
+from .metrics import metrics
+from .tapis_async import close_http_client
+from .tokens import tenant_key
 from .routers import (
     biospecimens,
     container_types,
@@ -128,10 +131,19 @@ async def add_uuid(request: Request, call_next):
 
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
-    """Adds a timing header to each service response."""
+    """Adds a timing header to each service response and records metrics."""
     start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
+    status_code = 500
+    metrics.request_started()
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        process_time = time.time() - start_time
+        # The router stores the matched endpoint in the shared scope
+        endpoint = request.scope.get("endpoint")
+        operation_id = getattr(endpoint, "__name__", "unmatched")
+        metrics.request_finished(operation_id, status_code, process_time)
     response.headers["X-Process-Time"] = str(process_time)
     return response
 
@@ -140,6 +152,25 @@ async def add_process_time_header(request: Request, call_next):
 async def startup_event():
     # Stores a timestamp so we can figure out how long the server has been up
     app.state.STARTUP_TIME = datetime.now()
+    # Load the tenant signing key up front so the first request doesn't wait on
+    # it, and keep it fresh. A failed load is retried rather than stopping boot
+    if settings.tapis_jwt_verify_local:
+        tenant_key.start()
+    # Start this worker's audit writer
+    start_audit_listener()
+    # Share this worker's metrics with the others
+    metrics.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Stop the service account token and tenant key refresh timers
+    service_client.reset()
+    tenant_key.stop()
+    await close_http_client()
+    # Write out any audit records still waiting in the queue
+    stop_audit_listener()
+    metrics.stop()
 
 
 class ApiStatus(BaseModel):
@@ -213,6 +244,14 @@ async def status_auth_check() -> dict:
     }
 
 
+@app.get("/status/metrics", tags=["status"], response_class=PlainTextResponse)
+async def status_metrics() -> str:
+    """Provides request and upstream metrics for all workers in Prometheus format."""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # User-mode routes
 app.include_router(auth.router)
 app.include_router(biospecimens.router)
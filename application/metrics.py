@@ -0,0 +1,318 @@
+"""In-process request and upstream metrics in Prometheus text format
+
+Each worker keeps its own counters and periodically writes a snapshot
+of them to <app_metrics_path>/worker-<pid>-<id>.json, where the random
+id tells apart workers that reuse a pid. The metrics endpoint merges
+the snapshots of every worker so that the numbers cover the whole
+service. Counters from workers that have exited are kept, since
+Prometheus expects them never to go down: their snapshots are folded
+into exited.json and removed, so the directory does not grow as
+workers are recycled.
+"""
+import fcntl
+import glob
+import json
+import os
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from .config import get_settings
+from .upstream import add_observer
+
+__all__ = ["Metrics", "metrics"]
+
+settings = get_settings()
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _write_json(path: str, data: Dict) -> None:
+    """Private: Atomically replace path with data serialized as JSON."""
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(snapshots: Iterable[Dict]) -> Dict:
+    """Private: Sum the counters of several snapshots."""
+    merged = {"latency": {}, "requests": {}, "upstream": {}, "in_flight": 0}
+    for snap in snapshots:
+        for key, values in snap["latency"].items():
+            total = merged["latency"].setdefault(key, [0] * len(values))
+            merged["latency"][key] = [a + b for a, b in zip(total, values)]
+        for key, count in snap["requests"].items():
+            merged["requests"][key] = merged["requests"].get(key, 0) + count
+        for key, values in snap["upstream"].items():
+            total = merged["upstream"].setdefault(key, [0, 0, 0.0])
+            merged["upstream"][key] = [a + b for a, b in zip(total, values)]
+        merged["in_flight"] += snap["in_flight"]
+    return merged
+
+
+def _labels(**labels) -> str:
+    escaped = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        escaped.append('{0}="{1}"'.format(key, value.replace("\n", "\\n")))
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metrics(object):
+    """Request latency histograms, status and upstream call counters.
+
+    All values live in plain dicts guarded by one lock, so recording a
+    request costs a few dict updates.
+    """
+
+    def __init__(
+        self, directory: str, buckets=DEFAULT_BUCKETS, interval: float = 10.0
+    ):
+        self.directory = directory
+        self.buckets = tuple(buckets)
+        self.interval = interval
+        self.pid = os.getpid()
+        self.worker = "{0}-{1}".format(self.pid, uuid.uuid4().hex[:12])
+        self._lock = threading.Lock()
+        self._timer = None
+        # operation_id -> [bucket counts..., +Inf count, sum]
+        self.latency: Dict[str, List[float]] = {}
+        # "operation_id status_code" -> count
+        self.requests: Dict[str, int] = {}
+        # call name -> [calls, errors, seconds]
+        self.upstream: Dict[str, List[float]] = {}
+        self.in_flight = 0
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(
+        self, operation_id: str, status_code: int, seconds: float
+    ) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            counts = self.latency.get(operation_id)
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1) + [0.0]
+                self.latency[operation_id] = counts
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += seconds
+            key = "{0} {1}".format(operation_id, status_code)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def upstream_call(self, name, args, kwargs, result, seconds, error) -> None:
+        with self._lock:
+            counts = self.upstream.setdefault(name, [0, 0, 0.0])
+            counts[0] += 1
+            if error is not None:
+                counts[1] += 1
+            counts[2] += seconds
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "pid": self.pid,
+                "worker": self.worker,
+                "buckets": list(self.buckets),
+                "latency": {k: list(v) for k, v in self.latency.items()},
+                "requests": dict(self.requests),
+                "upstream": {k: list(v) for k, v in self.upstream.items()},
+                "in_flight": self.in_flight,
+            }
+
+    def _snapshot_path(self, worker: str) -> str:
+        return os.path.join(self.directory, "worker-{0}.json".format(worker))
+
+    def write_snapshot(self) -> None:
+        """Save this worker's counters for the other workers to read."""
+        os.makedirs(self.directory, exist_ok=True)
+        _write_json(self._snapshot_path(self.worker), self.snapshot())
+
+    def _worker_snapshots(self) -> List[Dict]:
+        """Private: Returns the saved snapshots of the other workers."""
+        snapshots = []
+        for path in glob.glob(self._snapshot_path("*")):
+            snap = _read_json(path)
+            if snap is None or snap.get("worker") == self.worker:
+                continue
+            if snap.get("buckets") != list(self.buckets):
+                continue
+            snapshots.append(snap)
+        return snapshots
+
+    def fold_exited(self) -> None:
+        """Fold the snapshots of exited workers into exited.json.
+
+        The fold is done under a lock file so that workers never fold the
+        same snapshot twice. The workers folded are recorded until their
+        snapshots are removed, so a crash between the two steps does not
+        count them twice either.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "fold.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            exited_path = os.path.join(self.directory, "exited.json")
+            exited = _read_json(exited_path) or {"folded": [], "counters": None}
+            folded = [
+                w for w in exited["folded"] if os.path.exists(self._snapshot_path(w))
+            ]
+            dead = [
+                snap
+                for snap in self._worker_snapshots()
+                if snap["worker"] not in folded and not _pid_alive(snap["pid"])
+            ]
+            if dead:
+                for snap in dead:
+                    snap["in_flight"] = 0
+                counters = [c for c in [exited["counters"]] if c is not None]
+                exited = {
+                    "folded": folded + [snap["worker"] for snap in dead],
+                    "counters": _merge(counters + dead),
+                }
+                _write_json(exited_path, exited)
+            for worker in exited["folded"]:
+                try:
+                    os.remove(self._snapshot_path(worker))
+                except FileNotFoundError:
+                    pass
+
+    def _tick(self) -> None:
+        try:
+            self.write_snapshot()
+            self.fold_exited()
+        finally:
+            self._schedule()
+
+    def _schedule(self) -> None:
+        self._timer = threading.Timer(self.interval, self._tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def start(self) -> None:
+        """Start writing snapshots every interval seconds."""
+        if self.pid != os.getpid():
+            # Forked from the process that created this instance
+            self.pid = os.getpid()
+            self.worker = "{0}-{1}".format(self.pid, uuid.uuid4().hex[:12])
+        if self._timer is None:
+            self._schedule()
+
+    def stop(self) -> None:
+        """Stop the snapshot timer after writing a final snapshot."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.write_snapshot()
+
+    def collect(self) -> Dict:
+        """Merge the snapshots of all workers, using live values for this one."""
+        snapshots = [self.snapshot()]
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "fold.lock"), "w") as lock:
+            # Keep a concurrent fold from moving counters while they are read
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            exited = _read_json(os.path.join(self.directory, "exited.json"))
+            folded = []
+            if exited is not None and exited["counters"] is not None:
+                snapshots.append(exited["counters"])
+                folded = exited["folded"]
+            for snap in self._worker_snapshots():
+                if snap["worker"] in folded:
+                    continue
+                if not _pid_alive(snap["pid"]):
+                    snap["in_flight"] = 0
+                snapshots.append(snap)
+        return _merge(snapshots)
+
+    def render(self, merged: Optional[Dict] = None) -> str:
+        """Returns merged metrics in the Prometheus text exposition format."""
+        if merged is None:
+            merged = self.collect()
+        lines = [
+            "# HELP vbr_request_duration_seconds Request latency by operation",
+            "# TYPE vbr_request_duration_seconds histogram",
+        ]
+        for operation_id, counts in sorted(merged["latency"].items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(
+                    "vbr_request_duration_seconds_bucket{0} {1}".format(
+                        _labels(operation_id=operation_id, le=bound), cumulative
+                    )
+                )
+            cumulative += counts[len(self.buckets)]
+            lines.append(
+                "vbr_request_duration_seconds_bucket{0} {1}".format(
+                    _labels(operation_id=operation_id, le="+Inf"), cumulative
+                )
+            )
+            lines.append(
+                "vbr_request_duration_seconds_sum{0} {1}".format(
+                    _labels(operation_id=operation_id), counts[-1]
+                )
+            )
+            lines.append(
+                "vbr_request_duration_seconds_count{0} {1}".format(
+                    _labels(operation_id=operation_id), cumulative
+                )
+            )
+
+        lines.append("# HELP vbr_requests_total Requests by operation and status")
+        lines.append("# TYPE vbr_requests_total counter")
+        for key, count in sorted(merged["requests"].items()):
+            operation_id, status_code = key.rsplit(" ", 1)
+            lines.append(
+                "vbr_requests_total{0} {1}".format(
+                    _labels(operation_id=operation_id, status_code=status_code), count
+                )
+            )
+
+        lines.append("# HELP vbr_requests_in_flight Requests being handled")
+        lines.append("# TYPE vbr_requests_in_flight gauge")
+        lines.append("vbr_requests_in_flight {0}".format(merged["in_flight"]))
+
+        for metric, position, kind, help_text in (
+            ("vbr_upstream_calls_total", 0, "counter", "Upstream calls by method"),
+            ("vbr_upstream_errors_total", 1, "counter", "Failed upstream calls"),
+            ("vbr_upstream_seconds_total", 2, "counter", "Time in upstream calls"),
+        ):
+            lines.append("# HELP {0} {1}".format(metric, help_text))
+            lines.append("# TYPE {0} {1}".format(metric, kind))
+            for call, values in sorted(merged["upstream"].items()):
+                lines.append(
+                    "{0}{1} {2}".format(metric, _labels(call=call), values[position])
+                )
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(
+    settings.app_metrics_path or os.path.join(settings.app_log_path, "metrics"),
+    interval=settings.app_metrics_interval,
+)
+add_observer(metrics.upstream_call)
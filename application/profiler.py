@@ -0,0 +1,174 @@
+"""On-demand sampling profiler for single requests
+
+A profiler samples the stacks of the threads working on one request at a
+fixed interval and aggregates them in the folded-stack format read by
+flamegraph.pl, speedscope and similar tools. The event loop thread is
+shared by concurrent async requests, so samples taken there can include
+their frames as well. Sync endpoints run in a threadpool thread, which
+joins the profile through profiled_thread(): LoggingRoute wraps every
+endpoint with it, and batch helpers use it for their own threads.
+"""
+import glob
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from .config import get_settings
+
+__all__ = [
+    "SamplingProfiler",
+    "current_profiler",
+    "list_profiles",
+    "load_profile",
+    "profiled_thread",
+    "profiles_directory",
+    "save_profile",
+    "start_profiling",
+]
+
+settings = get_settings()
+
+profiles_directory = os.path.join(settings.app_log_path, "profiles")
+
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return "{0} ({1}:{2})".format(
+        code.co_name, os.path.basename(code.co_filename), code.co_firstlineno
+    )
+
+
+class SamplingProfiler(object):
+    """Samples the stacks of a set of threads until stopped.
+
+    Sampling stops by itself after max_seconds so a stuck request cannot
+    leave a profiler running.
+    """
+
+    def __init__(self, interval: float = 0.005, max_seconds: float = 60.0):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.threads = set()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_thread(self, ident: int = None) -> None:
+        self.threads.add(ident or threading.get_ident())
+
+    def remove_thread(self, ident: int = None) -> None:
+        self.threads.discard(ident or threading.get_ident())
+
+    def _sample(self) -> None:
+        frames = sys._current_frames()
+        for ident in list(self.threads):
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval):
+            if time.monotonic() > deadline:
+                break
+            self._sample()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        """Returns the samples as "frame;frame;frame count" lines."""
+        return "".join(
+            "{0} {1}\n".format(stack, count)
+            for stack, count in self.stacks.most_common()
+        )
+
+
+_profiler: ContextVar[Optional[SamplingProfiler]] = ContextVar(
+    "profiler", default=None
+)
+
+
+def start_profiling() -> SamplingProfiler:
+    """Start profiling the current request on the calling thread."""
+    profiler = SamplingProfiler(
+        interval=settings.app_profile_interval_ms / 1000.0,
+        max_seconds=settings.app_profile_max_seconds,
+    )
+    profiler.add_thread()
+    _profiler.set(profiler)
+    profiler.start()
+    return profiler
+
+
+def current_profiler() -> Optional[SamplingProfiler]:
+    return _profiler.get()
+
+
+@contextmanager
+def profiled_thread():
+    """Include the calling thread in the current request's profile, if any."""
+    profiler = _profiler.get()
+    if profiler is None:
+        yield
+        return
+    profiler.add_thread()
+    try:
+        yield
+    finally:
+        profiler.remove_thread()
+
+
+def save_profile(profile_id: str, profiler: SamplingProfiler) -> str:
+    """Write a profile to the profiles directory, returning its path."""
+    os.makedirs(profiles_directory, exist_ok=True)
+    path = os.path.join(profiles_directory, profile_id + ".folded")
+    with open(path, "w") as fh:
+        fh.write(profiler.folded())
+    return path
+
+
+def load_profile(profile_id: str) -> Optional[str]:
+    """Returns a saved profile, or None if there is no such profile."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(profiles_directory, profile_id + ".folded")) as fh:
+            return fh.read()
+    except FileNotFoundError:
+        return None
+
+
+def list_profiles() -> List[Dict]:
+    """Returns the saved profiles, newest first."""
+    profiles = []
+    for path in glob.glob(os.path.join(profiles_directory, "*.folded")):
+        stat = os.stat(path)
+        profiles.append(
+            {
+                "profile_id": os.path.basename(path)[: -len(".folded")],
+                "size": stat.st_size,
+                "created": stat.st_mtime,
+            }
+        )
+    return sorted(profiles, key=lambda p: p["created"], reverse=True)
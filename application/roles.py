@@ -0,0 +1,96 @@
+"""VBR role definitions and in-process role hierarchy evaluation"""
+from typing import FrozenSet, Iterable, List, Tuple
+
+__all__ = [
+    "DEFAULT_ROLE",
+    "ROLES",
+    "RELATIONS",
+    "RoleHierarchy",
+    "hierarchy",
+]
+
+DEFAULT_ROLE = ("VBR_USER", "Default user role")
+
+# VBR_ADMIN
+# - VBR_READ_ANY_PHI
+#   - VBR_READ_LIMITED_PHI
+#     - VBR_READ_PUBLIC
+#
+# VBR_ADMIN
+# - VBR_WRITE_ANY
+#   - VBR_WRITE_PUBLIC
+#
+# VBR_WRITE_ANY
+# - VBR_READ_ANY_PHI
+
+ROLES = [
+    ("VBR_ADMIN", "VBR Administrator"),
+    ("VBR_READ_ANY_PHI", "Can read any PHI data"),
+    ("VBR_READ_LIMITED_PHI", "Can read limited PHI data"),
+    ("VBR_READ_PUBLIC", "Can read only public data"),
+    ("VBR_WRITE_ANY", "Can write admin privileged fields and endpoints"),
+    ("VBR_WRITE_PUBLIC", "Can write only public fields and endpoints"),
+    DEFAULT_ROLE,
+]
+# (Parent, Child)
+RELATIONS = [
+    ("VBR_ADMIN", "VBR_WRITE_ANY"),  # Admin can write anything,
+    ("VBR_WRITE_ANY", "VBR_WRITE_PUBLIC"),
+    ("VBR_ADMIN", "VBR_READ_ANY_PHI"),  # Admin can read all PHI
+    ("VBR_READ_ANY_PHI", "VBR_READ_LIMITED_PHI"),  # Any PHI can read Limited PHI
+    ("VBR_READ_ANY_PHI", "VBR_READ_PUBLIC"),  # Limited PHI can read public
+    (
+        "VBR_WRITE_ANY",
+        "VBR_READ_ANY_PHI",
+    ),  # Anyone who can write ANY can read ANY
+    (
+        "VBR_WRITE_PUBLIC",
+        "VBR_READ_PUBLIC",
+    ),  # Anyone who can write public can read public
+]
+
+
+class RoleHierarchy(object):
+    """Evaluates inherited roles from (parent, child) relations.
+
+    This mirrors the role tree that scripts/create_roles.py creates in
+    Tapis SK, so the effective roles for a set of granted roles can be
+    computed without asking SK to expand them.
+    """
+
+    def __init__(
+        self,
+        roles: List[Tuple[str, str]],
+        relations: List[Tuple[str, str]],
+        default_role: str = None,
+    ):
+        self.children = {name: set() for name, _ in roles}
+        for parent, child in relations:
+            if parent != child:
+                self.children.setdefault(parent, set()).add(child)
+        if default_role is not None:
+            for name in self.children:
+                if name != default_role:
+                    self.children[name].add(default_role)
+        self._closures = {name: self._expand(name) for name in self.children}
+
+    def _expand(self, role: str) -> FrozenSet[str]:
+        seen = set()
+        stack = [role]
+        while stack:
+            name = stack.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            stack.extend(self.children.get(name, ()))
+        return frozenset(seen)
+
+    def closure(self, granted: Iterable[str]) -> FrozenSet[str]:
+        """Returns the granted roles plus every role they inherit."""
+        effective = set()
+        for name in granted:
+            effective |= self._closures.get(name, frozenset([name]))
+        return frozenset(effective)
+
+
+hierarchy = RoleHierarchy(ROLES, RELATIONS, default_role=DEFAULT_ROLE[0])
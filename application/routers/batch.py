@@ -0,0 +1,134 @@
+"""Set-based view and table queries and bounded fan-out for batch endpoints"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from fastapi import HTTPException, status
+from vbr.api import VBR_Api
+
+from ..config import get_settings
+from ..profiler import profiled_thread
+
+__all__ = [
+    "apply_each",
+    "check_batch_size",
+    "check_unique",
+    "query_table_in",
+    "query_view_in",
+]
+
+settings = get_settings()
+
+
+def check_batch_size(values: List, name: str = "ids") -> None:
+    """Raise a 400 error if a batch request names too many records."""
+    if len(values) > settings.app_batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At most {0} {1} may be sent in one request".format(
+                settings.app_batch_max_items, name
+            ),
+        )
+
+
+def check_unique(values: List, name: str = "ids") -> None:
+    """Raise a 400 error if a batch request names a record twice."""
+    seen, duplicates = set(), set()
+    for value in values:
+        if value in seen:
+            duplicates.add(value)
+        seen.add(value)
+    if duplicates:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Duplicate {0}: {1}".format(name, ", ".join(sorted(duplicates))),
+        )
+
+
+def apply_each(
+    func: Callable, items: List, concurrency: int = None
+) -> List[Tuple[Any, Exception]]:
+    """Call func on every item, at most concurrency at a time.
+
+    Returns a (result, None) or (None, exception) tuple for each item, in
+    the order of items, so one failure does not stop the others. Each
+    call runs in a copy of the caller's context, so its upstream calls
+    are still counted in the request's timing, trace and profile.
+    """
+    concurrency = concurrency or settings.app_batch_concurrency
+
+    def profiled(item):
+        with profiled_thread():
+            return func(item)
+
+    def call(context, item):
+        try:
+            return context.run(profiled, item), None
+        except Exception as exc:
+            return None, exc
+
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as pool:
+        futures = [
+            pool.submit(call, contextvars.copy_context(), item) for item in items
+        ]
+        return [f.result() for f in futures]
+
+
+def _in_queries(column: str, values: Iterable[str], chunk_size: int):
+    """Private: Yield (query, chunk) for pgREST `in` queries over values."""
+    wanted = list(dict.fromkeys(v for v in values if v))
+    for start in range(0, len(wanted), chunk_size):
+        chunk = wanted[start : start + chunk_size]
+        yield {column: {"operator": "in", "value": ",".join(chunk)}}, chunk
+
+
+def query_view_in(
+    client: VBR_Api,
+    view_name: str,
+    column: str,
+    values: Iterable[str],
+    chunk_size: int = None,
+) -> Dict[str, Dict]:
+    """Returns the rows of a view whose column is one of values, by value.
+
+    Values are sent with the pgREST `in` operator, chunk_size at a time,
+    so resolving a few hundred records takes a handful of queries rather
+    than one per record. Values must not contain commas; pass them
+    through sanitize_identifier_string first. When several rows share a
+    value, the first is kept.
+    """
+    rows = {}
+    for query, _ in _in_queries(
+        column, values, chunk_size or settings.app_batch_query_size
+    ):
+        for row in client.vbr_client.query_view_rows(
+            view_name=view_name, query=query, limit=0, offset=0
+        ):
+            rows.setdefault(row[column], row)
+    return rows
+
+
+def query_table_in(
+    client: VBR_Api,
+    table_name: str,
+    column: str,
+    values: Iterable[str],
+    chunk_size: int = None,
+) -> Dict[str, Any]:
+    """Returns the records of a table whose column is one of values, by value.
+
+    Like query_view_in, but returns VBR table records, which can be
+    passed to VBR_Api methods in place of a get_*_by_local_id lookup.
+    column should be unique, such as local_id.
+    """
+    records = {}
+    for query, chunk in _in_queries(
+        column, values, chunk_size or settings.app_batch_query_size
+    ):
+        for record in client.vbr_client.query_rows(
+            root_url=table_name, query=query, limit=len(chunk), offset=0
+        ):
+            records.setdefault(getattr(record, column), record)
+    return records
@@ -1,7 +1,8 @@
 """VBR Biospecimen routes"""
-from typing import Dict
+from typing import Callable, Dict
 
 from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from vbr.api import VBR_Api, measurement
 from vbr.utils.barcode import generate_barcode_string, sanitize_identifier_string
 
@@ -10,12 +11,18 @@ from application.routers.models.actions import comment, trackingid
 from ..dependencies import *
 from .models import (
     Biospecimen,
+    BiospecimenLookup,
     BiospecimenPrivate,
     BiospecimenPrivateExtended,
+    BiospecimenStatusUpdate,
+    BiospecimenUpdateResult,
+    BiospecimenVolumeUpdate,
     Comment,
     CreateComment,
     Event,
     GenericResponse,
+    Lookup,
+    LookupField,
     PartitionBiospecimen,
     RunListBase,
     SetBiospecimenStatus,
@@ -24,6 +31,9 @@ from .models import (
     SetVolume,
     transform,
 )
+from .batch import apply_each, check_batch_size, check_unique, query_view_in
+from .formats import ResponseFormat, tabular_response
+from .pagination import iter_page_batches, iter_view_rows, query_view_page
 from .utils import parameters_to_query
 
 router = APIRouter(
@@ -38,6 +48,7 @@ router = APIRouter(
     "/", dependencies=[Depends(vbr_read_public)], response_model=List[Biospecimen]
 )
 def list_biospecimens(
+    response: Response,
     # See views/biospecimens_details.sql for possible filter names
     biospecimen_id: Optional[str] = None,
     tracking_id: Optional[str] = None,
@@ -60,11 +71,13 @@ def list_biospecimens(
     bscp_protocol_dev: Optional[bool] = None,
     surgery_type: Optional[str] = None,
     client: VBR_Api = Depends(vbr_admin_client),
-    common=Depends(limit_offset),
+    common=Depends(limit_offset_cursor),
+    format: ResponseFormat = ResponseFormat.json,
 ):
     """List Biospecimens.
 
-    Refine results using filter parameters.
+    Refine results using filter parameters. Pass `format=csv` or
+    `format=parquet` to download the same page as a file.
 
     Requires: **VBR_READ_PUBLIC**"""
     query = parameters_to_query(
@@ -89,13 +102,32 @@ def list_biospecimens(
         bscp_protocol_dev=bscp_protocol_dev,
         surgery_type = surgery_type
     )
+    if format != ResponseFormat.json:
+        batches = iter_page_batches(
+            client,
+            view_name="biospecimens_details",
+            query=query,
+            common=common,
+            key="_measurement_id",
+            batch_size=settings.app_export_page_size,
+            response=response,
+        )
+        return tabular_response(
+            ([transform(c) for c in batch] for batch in batches),
+            Biospecimen,
+            format,
+            filename="biospecimens",
+            headers=response.headers,
+        )
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in query_view_page(
+            client,
             view_name="biospecimens_details",
             query=query,
-            limit=common["limit"],
-            offset=common["offset"],
+            common=common,
+            key="_measurement_id",
+            response=response,
         )
     ]
     return rows
@@ -108,6 +140,7 @@ def list_biospecimens(
     response_model=List[BiospecimenPrivateExtended],
 )
 def list_biospecimens_with_phi(
+    response: Response,
     biospecimen_id: Optional[str] = None,
     tracking_id: Optional[str] = None,
     biospecimen_type: Optional[str] = None,
@@ -131,7 +164,7 @@ def list_biospecimens_with_phi(
     sex: Optional[str] = None,
     surgery_type: Optional[str] = None,
     client: VBR_Api = Depends(vbr_admin_client),
-    common=Depends(limit_offset),
+    common=Depends(limit_offset_cursor),
 ):
     """List Biospecimens with PHI.
 
@@ -163,16 +196,131 @@ def list_biospecimens_with_phi(
     )
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in query_view_page(
+            client,
             view_name="biospecimens_details_private",
             query=query,
-            limit=common["limit"],
-            offset=common["offset"],
+            common=common,
+            key="_measurement_id",
+            response=response,
         )
     ]
     return rows
 
 
+# GET /export
+@router.get(
+    "/export",
+    dependencies=[Depends(vbr_read_public)],
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+def export_biospecimens(
+    request: Request,
+    # See views/biospecimens_details.sql for possible filter names
+    biospecimen_id: Optional[str] = None,
+    tracking_id: Optional[str] = None,
+    biospecimen_type: Optional[str] = None,
+    collection_id: Optional[str] = None,
+    collection_tracking_id: Optional[str] = None,
+    container_id: Optional[str] = None,
+    container_tracking_id: Optional[str] = None,
+    location_id: Optional[str] = None,
+    location_display_name: Optional[str] = None,
+    collection_site_location_id: Optional[str] = None,
+    collection_site_location_display_name: Optional[str] = None,
+    protocol_name: Optional[str] = None,
+    project: Optional[str] = None,
+    status: Optional[str] = None,
+    unit: Optional[str] = None,
+    subject_id: Optional[str] = None,
+    bscp_procby_initials: Optional[str] = None,
+    bscp_protocol_dev: Optional[bool] = None,
+    surgery_type: Optional[str] = None,
+    client: VBR_Api = Depends(vbr_admin_client),
+    auth: AuthContext = Depends(auth_context),
+):
+    """Export all matching Biospecimens as newline-delimited JSON.
+
+    Rows are streamed as they are read, a page at a time, so exports of
+    any size use constant memory. Callers with **VBR_READ_ANY_PHI** get
+    the PHI-extended records of `/private`.
+
+    Requires: **VBR_READ_PUBLIC**"""
+    query = parameters_to_query(
+        biospecimen_id=biospecimen_id,
+        tracking_id=tracking_id,
+        biospecimen_type=biospecimen_type,
+        collection_id=collection_id,
+        collection_tracking_id=collection_tracking_id,
+        container_id=container_id,
+        container_tracking_id=container_tracking_id,
+        location_id=location_id,
+        location_display_name=location_display_name,
+        collection_site_location_id=collection_site_location_id,
+        collection_site_location_display_name=collection_site_location_display_name,
+        protocol_name=protocol_name,
+        project=project,
+        status=status,
+        unit=unit,
+        subject_id=subject_id,
+        bscp_procby_initials=bscp_procby_initials,
+        bscp_protocol_dev=bscp_protocol_dev,
+        surgery_type=surgery_type,
+    )
+    if "VBR_READ_ANY_PHI" in auth.roles:
+        mark_phi(request)
+        view_name, model = "biospecimens_details_private", BiospecimenPrivateExtended
+    else:
+        view_name, model = "biospecimens_details", Biospecimen
+
+    def ndjson():
+        for row in iter_view_rows(
+            client,
+            view_name=view_name,
+            query=query,
+            key="_measurement_id",
+            page_size=settings.app_export_page_size,
+        ):
+            yield model(**transform(row)).json() + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+# POST /lookup
+@router.post(
+    "/lookup",
+    dependencies=[Depends(vbr_read_public)],
+    response_model=List[BiospecimenLookup],
+)
+def lookup_biospecimens(
+    body: Lookup = Body(...),
+    client: VBR_Api = Depends(vbr_admin_client),
+):
+    """Look up many Biospecimens by ID or tracking ID.
+
+    Set `by` to `tracking_id` to send tracking IDs. Results follow the
+    order of `ids`, with `found` false for any that match no Biospecimen.
+
+    Requires: **VBR_READ_PUBLIC**"""
+    check_batch_size(body.ids)
+    if body.by == LookupField.TRACKING_ID:
+        column = "tracking_id"
+    else:
+        column = "biospecimen_id"
+    keys = [sanitize_identifier_string(i) for i in body.ids]
+    rows = {
+        key: transform(row)
+        for key, row in query_view_in(
+            client, view_name="biospecimens_details", column=column, values=keys
+        ).items()
+    }
+    return [
+        {"query": query, "found": key in rows, "biospecimen": rows.get(key)}
+        for query, key in zip(body.ids, keys)
+    ]
+
+
 # GET /{biospecimen_id}
 @router.get(
     "/{biospecimen_id}",
@@ -406,6 +554,86 @@ def update_biospecimen_volume(
     return row
 
 
+def _bulk_update(client: VBR_Api, updates: List, update: Callable) -> List[Dict]:
+    """Private: Apply update to each Biospecimen and report on each.
+
+    Updates run concurrently, and the updated Biospecimens are read back
+    with set-based queries rather than one query each.
+    """
+    check_batch_size(updates, "updates")
+    ids = [sanitize_identifier_string(u.biospecimen_id) for u in updates]
+    check_unique(ids, "biospecimen_ids")
+    outcomes = apply_each(lambda args: update(*args), list(zip(ids, updates)))
+    rows = query_view_in(
+        client,
+        view_name="biospecimens_details",
+        column="biospecimen_id",
+        values=[i for i, (_, error) in zip(ids, outcomes) if error is None],
+    )
+    report = []
+    for biospecimen_id, (_, error) in zip(ids, outcomes):
+        row = rows.get(biospecimen_id)
+        report.append(
+            {
+                "biospecimen_id": biospecimen_id,
+                "updated": error is None,
+                "error": None if error is None else str(error),
+                "biospecimen": None if row is None else transform(row),
+            }
+        )
+    return report
+
+
+# PATCH /status
+@router.patch(
+    "/status",
+    dependencies=[Depends(vbr_write_public)],
+    response_model=List[BiospecimenUpdateResult],
+)
+def bulk_update_biospecimen_status(
+    body: List[BiospecimenStatusUpdate] = Body(...),
+    client: VBR_Api = Depends(vbr_admin_client),
+):
+    """Update the status of many Biospecimens.
+
+    Each update is applied on its own, so one failure does not stop the
+    rest. The report lists every update in order with its outcome.
+
+    Requires: **VBR_WRITE_PUBLIC**"""
+
+    def update(biospecimen_id: str, item: BiospecimenStatusUpdate):
+        measurement = client.get_measurement_by_local_id(biospecimen_id)
+        client.update_measurement_status_by_name(
+            measurement, status_name=item.status.value, comment=item.comment
+        )
+
+    return _bulk_update(client, body, update)
+
+
+# PATCH /volume
+@router.patch(
+    "/volume",
+    dependencies=[Depends(vbr_write_public)],
+    response_model=List[BiospecimenUpdateResult],
+)
+def bulk_update_biospecimen_volume(
+    body: List[BiospecimenVolumeUpdate] = Body(...),
+    client: VBR_Api = Depends(vbr_admin_client),
+):
+    """Update the volume of many Biospecimens.
+
+    Each update is applied on its own, so one failure does not stop the
+    rest. The report lists every update in order with its outcome.
+
+    Requires: **VBR_WRITE_PUBLIC**"""
+
+    def update(biospecimen_id: str, item: BiospecimenVolumeUpdate):
+        measurement = client.get_measurement_by_local_id(biospecimen_id)
+        client.set_volume(measurement, item.volume, item.comment)
+
+    return _bulk_update(client, body, update)
+
+
 # GET /{biospecimen_id}/events
 @router.get(
     "/{biospecimen_id}/events",
@@ -14,6 +14,7 @@ router = APIRouter(
     tags=["container_types"],
     responses={404: {"description": "Not found"}},
     route_class=LoggingRoute,
+    dependencies=[REFERENCE_CACHE_CONTROL],
 )
 
 
@@ -35,7 +36,8 @@ def list_container_types(
     query = parameters_to_query(container_type_id=container_type_id, name=name)
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in cached_view_rows(
+            client,
             view_name="container_types_public",
             query=query,
             limit=common["limit"],
@@ -59,8 +61,8 @@ def get_container_type_by_id(
     Requires: **VBR_READ_PUBLIC**"""
     query = {"container_type_id": {"operator": "eq", "value": container_type_id}}
     row = transform(
-        client.vbr_client.query_view_rows(
-            view_name="container_types_public", query=query, limit=1, offset=0
+        cached_view_rows(
+            client, view_name="container_types_public", query=query, limit=1, offset=0
         )[0]
     )
     return row
@@ -86,6 +88,8 @@ def create_container_type(
     except Exception as exc:
         raise HTTPException(500, "Failed to create new container type: {0}".format(exc))
 
+    invalidate_reference_data()
+
     query = {"container_type_id": {"operator": "eq", "value": container_type.local_id}}
     row = transform(
         client.vbr_client.query_view_rows(
@@ -111,6 +115,7 @@ def delete_container_type(
     container_type_id = vbr.utils.sanitize_identifier_string(container_type_id)
     container_type = client.get_container_type_by_local_id(container_type_id)
     client.vbr_client.delete_row(container_type)
+    invalidate_reference_data()
     return {"message": "ContainerType deleted"}
 
 
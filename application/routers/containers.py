@@ -13,15 +13,21 @@ from .models import (
     Biospecimen,
     Comment,
     Container,
+    ContainerLookup,
     CreateComment,
     CreateContainer,
     Event,
     GenericResponse,
+    Lookup,
+    LookupField,
     SetContainerLocation,
     SetContainerStatus,
     SetTrackingId,
     transform,
 )
+from .batch import check_batch_size, query_view_in
+from .formats import ResponseFormat, tabular_response
+from .pagination import iter_page_batches, query_view_page
 from .utils import parameters_to_query
 
 router = APIRouter(
@@ -36,6 +42,7 @@ router = APIRouter(
     "/", dependencies=[Depends(vbr_read_public)], response_model=List[Container]
 )
 def list_containers(
+    response: Response,
     # See views/containers_public.sql for possible filter names
     container_id: Optional[str] = None,
     container_tracking_id: Optional[str] = None,
@@ -45,11 +52,13 @@ def list_containers(
     status: Optional[str] = None,
     tracking_id: Optional[str] = None,
     client: VBR_Api = Depends(vbr_admin_client),
-    common=Depends(limit_offset),
+    common=Depends(limit_offset_cursor),
+    format: ResponseFormat = ResponseFormat.json,
 ):
     """List Containers.
 
-    Refine results using filter parameters.
+    Refine results using filter parameters. Pass `format=csv` or
+    `format=parquet` to download the same page as a file.
 
     Requires: **VBR_READ_PUBLIC**"""
     query = parameters_to_query(
@@ -61,13 +70,32 @@ def list_containers(
         status=status,
         tracking_id=tracking_id,
     )
+    if format != ResponseFormat.json:
+        batches = iter_page_batches(
+            client,
+            view_name="containers_public",
+            query=query,
+            common=common,
+            key="_container_row_id",
+            batch_size=settings.app_export_page_size,
+            response=response,
+        )
+        return tabular_response(
+            ([transform(c) for c in batch] for batch in batches),
+            Container,
+            format,
+            filename="containers",
+            headers=response.headers,
+        )
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in query_view_page(
+            client,
             view_name="containers_public",
             query=query,
-            limit=common["limit"],
-            offset=common["offset"],
+            common=common,
+            key="_container_row_id",
+            response=response,
         )
     ]
     return rows
@@ -125,6 +153,40 @@ def create_container(
     return row
 
 
+# POST /lookup
+@router.post(
+    "/lookup",
+    dependencies=[Depends(vbr_read_public)],
+    response_model=List[ContainerLookup],
+)
+def lookup_containers(
+    body: Lookup = Body(...),
+    client: VBR_Api = Depends(vbr_admin_client),
+):
+    """Look up many Containers by ID or tracking ID.
+
+    Set `by` to `tracking_id` to send tracking IDs. Results follow the
+    order of `ids`, with `found` false for any that match no Container.
+
+    Requires: **VBR_READ_PUBLIC**"""
+    check_batch_size(body.ids)
+    if body.by == LookupField.TRACKING_ID:
+        column = "container_tracking_id"
+    else:
+        column = "container_id"
+    keys = [sanitize_identifier_string(i) for i in body.ids]
+    rows = {
+        key: transform(row)
+        for key, row in query_view_in(
+            client, view_name="containers_public", column=column, values=keys
+        ).items()
+    }
+    return [
+        {"query": query, "found": key in rows, "container": rows.get(key)}
+        for query, key in zip(body.ids, keys)
+    ]
+
+
 # GET /{container_id}
 @router.get(
     "/{container_id}", dependencies=[Depends(vbr_read_public)], response_model=Container
@@ -0,0 +1,157 @@
+"""CSV and Parquet output for list endpoints
+
+Rows are fetched in batches and written straight from the view's dicts
+into each format's buffers, then streamed, without building a response
+model per row. Parquet output needs the optional pyarrow package.
+"""
+import csv
+import io
+import typing
+from enum import Enum
+from typing import Dict, Iterable, Iterator, List, Mapping, Type
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+__all__ = ["ResponseFormat", "tabular_response"]
+
+
+class ResponseFormat(str, Enum):
+    json = "json"
+    csv = "csv"
+    parquet = "parquet"
+
+
+MEDIA_TYPES = {
+    ResponseFormat.csv: "text/csv",
+    ResponseFormat.parquet: "application/vnd.apache.parquet",
+}
+
+
+def _fields(model: Type[BaseModel]) -> Dict[str, type]:
+    """Private: Returns the field names of a model and their base types."""
+    hints = typing.get_type_hints(model)
+    names = getattr(model, "model_fields", None) or model.__fields__
+    fields = {}
+    for name in names:
+        hint = hints.get(name, str)
+        args = [a for a in typing.get_args(hint) if a is not type(None)]
+        if typing.get_origin(hint) is typing.Union and len(args) == 1:
+            hint = args[0]
+        fields[name] = hint
+    return fields
+
+
+def _csv_stream(batches: Iterable[List[Dict]], columns: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows([[row.get(c) for c in columns] for row in batch])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _ChunkSink(object):
+    """Private: A write-only file that hands back what was written so far.
+
+    Keeps track of its own position, which the Parquet writer needs for
+    the file footer, while letting written bytes be streamed and freed.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_type(hint: type):
+    # Dates and times are kept as the ISO strings pgREST returns
+    if hint is bool:
+        return pyarrow.bool_()
+    if hint is int:
+        return pyarrow.int64()
+    if hint is float:
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def _parquet_stream(
+    batches: Iterable[List[Dict]], fields: Dict[str, type]
+) -> Iterator[bytes]:
+    schema = pyarrow.schema([(name, _arrow_type(t)) for name, t in fields.items()])
+    strings = [f.name for f in schema if f.type == pyarrow.string()]
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    try:
+        for batch in batches:
+            # One column buffer per field, written as one row group
+            columns = {name: [row.get(name) for row in batch] for name in fields}
+            for name in strings:
+                columns[name] = [None if v is None else str(v) for v in columns[name]]
+            writer.write_table(pyarrow.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def tabular_response(
+    batches: Iterable[List[Dict]],
+    model: Type[BaseModel],
+    response_format: ResponseFormat,
+    filename: str,
+    headers: Mapping[str, str] = None,
+) -> StreamingResponse:
+    """Stream batches of rows as CSV or Parquet with the fields of model.
+
+    headers, such as the X-Next-Cursor set by iter_page_batches, are
+    added to the response.
+    """
+    fields = _fields(model)
+    if response_format == ResponseFormat.parquet:
+        if pyarrow is None:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="Parquet output requires pyarrow, which is not installed",
+            )
+        body = _parquet_stream(batches, fields)
+    else:
+        body = _csv_stream(batches, list(fields))
+    headers = dict(headers or {})
+    headers["Content-Disposition"] = 'attachment; filename="{0}.{1}"'.format(
+        filename, response_format.value
+    )
+    return StreamingResponse(
+        body, media_type=MEDIA_TYPES[response_format], headers=headers
+    )
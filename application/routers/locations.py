@@ -14,6 +14,7 @@ router = APIRouter(
     tags=["locations"],
     responses={404: {"description": "Not found"}},
     route_class=LoggingRoute,
+    dependencies=[REFERENCE_CACHE_CONTROL],
 )
 
 
@@ -40,7 +41,8 @@ def list_locations(
     )
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in cached_view_rows(
+            client,
             view_name="locations_public",
             query=query,
             limit=common["limit"],
@@ -62,8 +64,8 @@ def get_location_by_id(
     Requires: **VBR_READ_PUBLIC**"""
     query = {"location_id": {"operator": "eq", "value": location_id}}
     row = transform(
-        client.vbr_client.query_view_rows(
-            view_name="locations_public", query=query, limit=1, offset=0
+        cached_view_rows(
+            client, view_name="locations_public", query=query, limit=1, offset=0
         )[0]
     )
     return row
@@ -3,6 +3,7 @@ from .comment import *
 from .container import *
 from .container_type import *
 from .location import *
+from .lookup import *
 from .runlist import *
 from .runlist_type import *
 from .shipment import *
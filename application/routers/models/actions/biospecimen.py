@@ -3,7 +3,12 @@ from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
-__all__ = ["AddBiospecimen", "PartitionBiospecimen", "SetVolume"]
+__all__ = [
+    "AddBiospecimen",
+    "BiospecimenVolumeUpdate",
+    "PartitionBiospecimen",
+    "SetVolume",
+]
 
 
 class AddBiospecimen(BaseModel):
@@ -22,3 +27,7 @@ class PartitionBiospecimen(BaseModel):
 class SetVolume(BaseModel):
     volume: float
     comment: Optional[str] = Field(None, title="Optional comment")
+
+
+class BiospecimenVolumeUpdate(SetVolume):
+    biospecimen_id: str
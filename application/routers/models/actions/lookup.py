@@ -0,0 +1,16 @@
+from enum import Enum
+from typing import List
+
+from pydantic import BaseModel, Field
+
+__all__ = ["Lookup", "LookupField"]
+
+
+class LookupField(Enum):
+    ID = "id"
+    TRACKING_ID = "tracking_id"
+
+
+class Lookup(BaseModel):
+    ids: List[str] = Field(..., title="IDs or tracking IDs to look up")
+    by: LookupField = Field(LookupField.ID, title="Which kind of ID was sent")
@@ -2,7 +2,12 @@ from typing import Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
-__all__ = ["CreateRunList", "CreateRunListWithBiospecimens", "UpdateRunList"]
+__all__ = [
+    "CreateRunList",
+    "CreateRunListWithBiospecimens",
+    "ReplaceBiospecimens",
+    "UpdateRunList",
+]
 
 
 class CreateRunList(BaseModel):
@@ -22,3 +27,7 @@ class UpdateRunList(BaseModel):
     name: Optional[str]
     description: Optional[str]
     tracking_id: Optional[str]
+
+
+class ReplaceBiospecimens(BaseModel):
+    biospecimen_ids: List[str] = Field(default=[])
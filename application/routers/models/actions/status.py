@@ -47,6 +47,10 @@ class SetBiospecimenStatus(BaseModel):
     comment: Optional[str]
 
 
+class BiospecimenStatusUpdate(SetBiospecimenStatus):
+    biospecimen_id: str
+
+
 class SetContainerStatus(BaseModel):
     status: ContainerStatuses
     comment: Optional[str]
@@ -9,6 +9,8 @@ __all__ = [
     "Biospecimen",
     "BiospecimenPrivate",
     "BiospecimenPrivateExtended",
+    "BiospecimenLookup",
+    "BiospecimenUpdateResult",
 ]
 
 
@@ -55,3 +57,16 @@ class BiospecimenPrivateExtended(BiospecimenPrivate):
     age: Optional[int]
     race: Optional[str]
     ethnicity: Optional[str] = None
+
+
+class BiospecimenLookup(BaseModel):
+    query: str
+    found: bool
+    biospecimen: Optional[Biospecimen]
+
+
+class BiospecimenUpdateResult(BaseModel):
+    biospecimen_id: str
+    updated: bool
+    error: Optional[str]
+    biospecimen: Optional[Biospecimen]
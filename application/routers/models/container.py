@@ -4,7 +4,7 @@ from uuid import UUID
 
 from pydantic import BaseModel, Field
 
-__all__ = ["Container"]
+__all__ = ["Container", "ContainerLookup"]
 
 
 class Container(BaseModel):
@@ -15,3 +15,9 @@ class Container(BaseModel):
     location_display_name: Optional[str]
     status: Optional[str]
     tracking_id: Optional[str]
+
+
+class ContainerLookup(BaseModel):
+    query: str
+    found: bool
+    container: Optional[Container]
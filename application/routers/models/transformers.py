@@ -1,5 +1,7 @@
 from typing import Dict, List
 
+from ...timing import span
+
 __all__ = ["transform"]
 
 
@@ -40,5 +42,6 @@ def transform_redcap(data: Dict) -> Dict:
 
 
 def transform(data: Dict) -> Dict:
-    data = transform_redcap(data)
+    with span("transform"):
+        data = transform_redcap(data)
     return data
@@ -14,6 +14,7 @@ router = APIRouter(
     tags=["organizations"],
     responses={404: {"description": "Not found"}},
     route_class=LoggingRoute,
+    dependencies=[REFERENCE_CACHE_CONTROL],
 )
 
 
@@ -35,7 +36,8 @@ def list_organizations(
     query = parameters_to_query(organization_id=organization_id, name=name)
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in cached_view_rows(
+            client,
             view_name="organizations_public",
             query=query,
             limit=common["limit"],
@@ -59,8 +61,8 @@ def get_organization_by_id(
     Requires: **VBR_READ_PUBLIC**"""
     query = {"organization_id": {"operator": "eq", "value": organization_id}}
     row = transform(
-        client.vbr_client.query_view_rows(
-            view_name="organizations_public", query=query, limit=1, offset=0
+        cached_view_rows(
+            client, view_name="organizations_public", query=query, limit=1, offset=0
         )[0]
     )
     return row
@@ -0,0 +1,158 @@
+"""Offset and keyset (cursor) pagination of view queries"""
+import base64
+import json
+from typing import Any, Dict, Iterator, List, Tuple
+
+from fastapi import HTTPException, Response, status
+from vbr.api import VBR_Api
+
+__all__ = [
+    "decode_cursor",
+    "encode_cursor",
+    "iter_page_batches",
+    "iter_view_rows",
+    "query_view_page",
+]
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(key: str, value: Any) -> str:
+    """Returns an opaque cursor that resumes after value of column key."""
+    raw = json.dumps([key, value], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, key: str) -> Any:
+    """Returns the value a cursor resumes after.
+
+    Raises ValueError if the cursor is malformed or was issued for a
+    different column."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_key, value = json.loads(base64.urlsafe_b64decode(padded))
+    except (TypeError, ValueError):
+        raise ValueError("Malformed cursor")
+    if cursor_key != key:
+        raise ValueError("Cursor does not belong to this listing")
+    return value
+
+
+def _page_start(query: Dict, common: Dict, key: str) -> Tuple[Dict, int]:
+    """Private: Returns the query and offset for the first row of a page."""
+    if not common.get("cursor"):
+        return query, common["offset"]
+    try:
+        value = decode_cursor(common["cursor"], key)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    query = dict(query)
+    query[key] = {"operator": "gt", "value": value}
+    return query, 0
+
+
+def query_view_page(
+    client: VBR_Api,
+    view_name: str,
+    query: Dict,
+    common: Dict,
+    key: str,
+    response: Response,
+) -> List[Dict]:
+    """Query one page of a view by offset or, given a cursor, by keyset.
+
+    The view must be ordered ascending on key, and key must be unique:
+    rows sharing the last key of a page would be skipped. A keyset page
+    selects rows with key greater than the cursor value, so its cost
+    does not grow with depth and concurrent inserts do not shift later
+    pages. When a page is full, a cursor for the next page is returned
+    in the X-Next-Cursor header, whichever way the page was selected.
+    """
+    limit = common["limit"]
+    query, offset = _page_start(query, common, key)
+    rows = client.vbr_client.query_view_rows(
+        view_name=view_name, query=query, limit=limit, offset=offset
+    )
+    if limit and len(rows) >= limit and key in rows[-1]:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(key, rows[-1][key])
+    return rows
+
+
+def iter_view_rows(
+    client: VBR_Api, view_name: str, query: Dict, key: str, page_size: int
+) -> Iterator[Dict]:
+    """Yield every row of a view matching query, one keyset page at a time.
+
+    Only one page is held in memory, and each page is a cheap range scan
+    on key, so this suits exporting whole views. The view must be ordered
+    ascending on key, which must be unique.
+    """
+    page_query = dict(query)
+    while True:
+        rows = client.vbr_client.query_view_rows(
+            view_name=view_name, query=page_query, limit=page_size, offset=0
+        )
+        yield from rows
+        if len(rows) < page_size:
+            return
+        page_query[key] = {"operator": "gt", "value": rows[-1][key]}
+
+
+def iter_page_batches(
+    client: VBR_Api,
+    view_name: str,
+    query: Dict,
+    common: Dict,
+    key: str,
+    batch_size: int,
+    response: Response,
+) -> Iterator[List[Dict]]:
+    """Yield the page that query_view_page would return, in batches.
+
+    The first batch starts at the requested offset or cursor and each
+    later batch continues by keyset, until the page limit is reached. A
+    limit of 0 or less means no limit, as it does for query_view_page.
+    A bad cursor is rejected here rather than once streaming has begun.
+    As for query_view_page, key must be unique.
+
+    The X-Next-Cursor header must be set before the first row is sent,
+    so the last row of a full page is looked up first, with one small
+    query, and the page is cut off at it.
+    """
+    query, offset = _page_start(query, common, key)
+    limit = common["limit"]
+    last = None
+    if limit > 0:
+        tail = client.vbr_client.query_view_rows(
+            view_name=view_name, query=query, limit=1, offset=offset + limit - 1
+        )
+        if tail and key in tail[0]:
+            last = tail[0][key]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(key, last)
+
+    def batches():
+        page_query = query
+        start = offset
+        remaining = limit if limit > 0 else None
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            rows = client.vbr_client.query_view_rows(
+                view_name=view_name, query=page_query, limit=size, offset=start
+            )
+            full = len(rows) == size
+            if last is not None:
+                # Rows inserted since the look-up must not pass the cursor
+                kept = [r for r in rows if r[key] <= last]
+                full = full and len(kept) == len(rows) and kept[-1][key] != last
+                rows = kept
+            if rows:
+                yield rows
+            if not full:
+                return
+            if remaining is not None:
+                remaining -= len(rows)
+            start = 0
+            page_query = dict(page_query)
+            page_query[key] = {"operator": "gt", "value": rows[-1][key]}
+
+    return batches()
@@ -14,6 +14,7 @@ router = APIRouter(
     tags=["projects"],
     responses={404: {"description": "Not found"}},
     route_class=LoggingRoute,
+    dependencies=[REFERENCE_CACHE_CONTROL],
 )
 
 
@@ -41,7 +42,8 @@ def list_projects(
     )
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in cached_view_rows(
+            client,
             view_name="projects_public",
             query=query,
             limit=common["limit"],
@@ -63,8 +65,8 @@ def get_project_by_id(
     Requires: **VBR_READ_PUBLIC**"""
     query = {"project_id": {"operator": "eq", "value": project_id}}
     row = transform(
-        client.vbr_client.query_view_rows(
-            view_name="projects_public", query=query, limit=1, offset=0
+        cached_view_rows(
+            client, view_name="projects_public", query=query, limit=1, offset=0
         )[0]
     )
     return row
@@ -14,6 +14,7 @@ router = APIRouter(
     tags=["runlist_types"],
     responses={404: {"description": "Not found"}},
     route_class=LoggingRoute,
+    dependencies=[REFERENCE_CACHE_CONTROL],
 )
 
 
@@ -35,7 +36,8 @@ def list_runlist_types(
     query = parameters_to_query(runlist_type_id=runlist_type_id, name=name)
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in cached_view_rows(
+            client,
             view_name="runlist_types_public",
             query=query,
             limit=common["limit"],
@@ -59,8 +61,8 @@ def get_runlist_type_by_id(
     Requires: **VBR_READ_PUBLIC**"""
     query = {"runlist_type_id": {"operator": "eq", "value": runlist_type_id}}
     row = transform(
-        client.vbr_client.query_view_rows(
-            view_name="runlist_types_public", query=query, limit=1, offset=0
+        cached_view_rows(
+            client, view_name="runlist_types_public", query=query, limit=1, offset=0
         )[0]
     )
     return row
@@ -84,6 +86,8 @@ def create_runlist_type(
     except Exception as exc:
         raise HTTPException(500, "Failed to create new container type: {0}".format(exc))
 
+    invalidate_reference_data()
+
     query = {"runlist_type_id": {"operator": "eq", "value": runlist_type.local_id}}
     row = transform(
         client.vbr_client.query_view_rows(
@@ -109,6 +113,7 @@ def delete_runlist_type(
     runlist_type_id = vbr.utils.sanitize_identifier_string(runlist_type_id)
     runlist_type = client.get_collection_type_by_local_id(runlist_type_id)
     client.vbr_client.delete_row(runlist_type)
+    invalidate_reference_data()
     return {"message": "RunlistType deleted"}
 
 
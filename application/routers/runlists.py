@@ -11,6 +11,7 @@ from application.routers.models.actions.comment import Comment
 from application.routers.models.actions.runlist import (
     CreateRunList,
     CreateRunListWithBiospecimens,
+    ReplaceBiospecimens,
     UpdateRunList,
 )
 
@@ -24,6 +25,8 @@ from .models import (
     RunList,
     transform,
 )
+from .batch import apply_each, check_batch_size, query_table_in
+from .pagination import query_view_page
 from .utils import parameters_to_query
 
 router = APIRouter(
@@ -36,6 +39,7 @@ router = APIRouter(
 # GET /runlists
 @router.get("/", dependencies=[Depends(vbr_read_public)], response_model=List[RunList])
 def list_runlists(
+    response: Response,
     # See views/runlists_base.sql for possible filter names
     runlist_id: Optional[str] = None,
     tracking_id: Optional[str] = None,
@@ -45,7 +49,7 @@ def list_runlists(
     location_id: Optional[str] = None,
     location_display_name: Optional[str] = None,
     client: VBR_Api = Depends(vbr_admin_client),
-    common=Depends(limit_offset),
+    common=Depends(limit_offset_cursor),
 ):
     """List RunLists.
 
@@ -63,16 +67,74 @@ def list_runlists(
     )
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in query_view_page(
+            client,
             view_name="runlists_public",
             query=query,
-            limit=common["limit"],
-            offset=common["offset"],
+            common=common,
+            key="_runlist_id",
+            response=response,
         )
     ]
     return rows
 
 
+def _biospecimen_ids(biospecimen_ids: List[str]) -> List[str]:
+    """Private: Sanitize and de-duplicate the Biospecimen IDs of a request."""
+    check_batch_size(biospecimen_ids, "biospecimen_ids")
+    return list(dict.fromkeys(sanitize_identifier_string(b) for b in biospecimen_ids))
+
+
+def _measurements(client: VBR_Api, biospecimen_ids: List[str]) -> Dict:
+    """Private: Returns the Measurement behind each Biospecimen ID, by ID.
+
+    All IDs are resolved with set-based queries before anything is
+    changed, and a 404 names every ID that could not be found.
+    """
+    found = query_table_in(
+        client, table_name="measurement", column="local_id", values=biospecimen_ids
+    )
+    missing = [b for b in biospecimen_ids if b not in found]
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail="Unable to find biospecimen_ids: {0}".format(", ".join(missing)),
+        )
+    return {b: found[b] for b in biospecimen_ids}
+
+
+def _change_membership(client: VBR_Api, collection, add: List, remove: List) -> None:
+    """Private: Add and remove Measurements from a RunList's collection.
+
+    Measurements are already resolved, so each change is a single write.
+    Changes are applied concurrently. Each is independent, so after a
+    failure, repeating the request applies only what is still missing.
+    """
+
+    def change(args):
+        action, measurement = args
+        if action == "add":
+            client.associate_measurement_with_collection(measurement, collection)
+        else:
+            client.disassociate_measurement_from_collection(measurement, collection)
+
+    changes = [("add", m) for m in add] + [("remove", m) for m in remove]
+    failed = [
+        "{0} {1}: {2}".format(action, measurement.local_id, error)
+        for (action, measurement), (_, error) in zip(
+            changes, apply_each(change, changes)
+        )
+        if error is not None
+    ]
+    if failed:
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to update runlist {0}: {1}".format(
+                collection.local_id, "; ".join(failed)
+            ),
+        )
+
+
 # POST /runlists
 # Create a new runlist
 @router.post("/", dependencies=[Depends(vbr_write_public)], response_model=RunList)
@@ -106,13 +168,7 @@ def create_runlist(
     except Exception:
         raise HTTPException(404, "Unable to find location {0}".format(location_id))
 
-    try:
-        biospecimens = [client.get_measurement_by_local_id(b) for b in biospecimen_ids]
-    except Exception as exc:
-        raise HTTPException(
-            status_code=404,
-            detail="One or more biospecimen_ids could not be resolved: {0}".format(exc),
-        )
+    measurements = _measurements(client, _biospecimen_ids(biospecimen_ids))
     data = {
         "name": name,
         "description": description,
@@ -122,14 +178,15 @@ def create_runlist(
     }
     try:
         collection = client.create_collection(**data)
-        # Ff containers are provided, associate them with Shipment
-        for measurement in biospecimens:
-            try:
-                client.associate_measurement_with_collection(measurement, collection)
-            except Exception:
-                # TODO improve error handling
-                raise
+    except Exception as exc:
+        raise HTTPException(500, "Error creating runlist: {0}".format(exc))
 
+    # If biospecimens are provided, associate them with the RunList. On a
+    # partial failure the error names the runlist, which can be completed
+    # with PUT /{runlist_id}/biospecimens:replace
+    _change_membership(client, collection, add=list(measurements.values()), remove=[])
+
+    try:
         # Return created runlist
         # The query is on on runlist_id because we have mapped the VBR collection schema to
         # the more specific runlist schema in our runlists_base view
@@ -306,6 +363,65 @@ def add_biospecimen_to_runlist(
     return rows
 
 
+# PUT /:id:/biospecimens:replace
+# Set the biospecimens in a runlist
+@router.put(
+    "/{runlist_id}/biospecimens:replace",
+    dependencies=[Depends(vbr_write_public)],
+    response_model=List[BiospecimenIds],
+)
+def replace_biospecimens_in_runlist(
+    runlist_id: str,
+    body: ReplaceBiospecimens = Body(...),
+    client: VBR_Api = Depends(vbr_admin_client),
+):
+    """Replace the Biospecimens in a RunList.
+
+    Only the difference from the current membership is applied: missing
+    Biospecimens are added and unlisted ones removed.
+
+    Requires: **VBR_WRITE_PUBLIC**
+    """
+    runlist_id = sanitize_identifier_string(runlist_id)
+    biospecimen_ids = _biospecimen_ids(body.biospecimen_ids)
+    collection = client.get_collection_by_local_id(runlist_id)
+
+    query = {"runlist_id": {"operator": "=", "value": runlist_id}}
+    current = [
+        c["biospecimen_id"]
+        for c in client.vbr_client.query_view_rows(
+            view_name="runlists_biospecimens_public",
+            query=query,
+            limit=0,
+            offset=0,
+        )
+        # An empty runlist has one row with no biospecimen
+        if c["biospecimen_id"] is not None
+    ]
+    wanted, present = set(biospecimen_ids), set(current)
+    add = [b for b in biospecimen_ids if b not in present]
+    remove = [b for b in current if b not in wanted]
+    # One set-based lookup resolves the Measurements of every change
+    measurements = _measurements(client, add + remove)
+    _change_membership(
+        client,
+        collection,
+        add=[measurements[b] for b in add],
+        remove=[measurements[b] for b in remove],
+    )
+
+    rows = [
+        transform(c)
+        for c in client.vbr_client.query_view_rows(
+            view_name="runlists_biospecimens_public",
+            query=query,
+            limit=0,
+            offset=0,
+        )
+    ]
+    return rows
+
+
 # DELETE /{runlist_id}/biospecimens/{biospecimen_id}
 # Remove a biospecimen from a runlist
 @router.delete(
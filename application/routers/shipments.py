@@ -19,6 +19,8 @@ from .models import (
     Shipment,
     transform,
 )
+from .formats import ResponseFormat, tabular_response
+from .pagination import iter_page_batches, query_view_page
 from .utils import parameters_to_query
 
 router = APIRouter(
@@ -31,6 +33,7 @@ router = APIRouter(
 
 @router.get("/", dependencies=[Depends(vbr_read_public)], response_model=List[Shipment])
 def list_shipments(
+    response: Response,
     # See views/shipments_public.sql for possible filter names
     shipment_id: Optional[str] = None,
     tracking_id: Optional[str] = None,
@@ -41,11 +44,13 @@ def list_shipments(
     ship_to: Optional[str] = None,
     status: Optional[str] = None,
     client: VBR_Api = Depends(vbr_admin_client),
-    common=Depends(limit_offset),
+    common=Depends(limit_offset_cursor),
+    format: ResponseFormat = ResponseFormat.json,
 ):
     """List Shipments.
 
-    Refine results using filter parameters.
+    Refine results using filter parameters. Pass `format=csv` or
+    `format=parquet` to download the same page as a file.
 
     Requires: **VBR_READ_PUBLIC**"""
     query = parameters_to_query(
@@ -57,13 +62,32 @@ def list_shipments(
         ship_to=ship_to,
         status=status,
     )
+    if format != ResponseFormat.json:
+        batches = iter_page_batches(
+            client,
+            view_name="shipments_public",
+            query=query,
+            common=common,
+            key="_shipment_id",
+            batch_size=settings.app_export_page_size,
+            response=response,
+        )
+        return tabular_response(
+            ([transform(c) for c in batch] for batch in batches),
+            Shipment,
+            format,
+            filename="shipments",
+            headers=response.headers,
+        )
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in query_view_page(
+            client,
             view_name="shipments_public",
             query=query,
-            limit=common["limit"],
-            offset=common["offset"],
+            common=common,
+            key="_shipment_id",
+            response=response,
         )
     ]
     return rows
@@ -7,6 +7,8 @@ from vbr.utils.barcode import generate_barcode_string, sanitize_identifier_strin
 
 from ..dependencies import *
 from .models import Subject, SubjectPrivate, SubjectPrivateExtended, transform
+from .formats import ResponseFormat, tabular_response
+from .pagination import iter_page_batches, query_view_page
 from .utils import parameters_to_query
 
 router = APIRouter(
@@ -19,29 +21,51 @@ router = APIRouter(
 
 @router.get("/", dependencies=[Depends(vbr_read_public)], response_model=List[Subject])
 def list_subjects(
+    response: Response,
     # See views/subjects_public.sql for possible filter names
     subject_id: Optional[str] = None,
     subject_guid: Optional[str] = None,
     project: Optional[str] = None,
     client: VBR_Api = Depends(vbr_admin_client),
-    common=Depends(limit_offset),
+    common=Depends(limit_offset_cursor),
+    format: ResponseFormat = ResponseFormat.json,
 ):
     """List Subjects.
 
-    Refine results using filter parameters.
+    Refine results using filter parameters. Pass `format=csv` or
+    `format=parquet` to download the same page as a file.
 
     Requires: **VBR_READ_PUBLIC**"""
     # TODO - build up from filters
     query = parameters_to_query(
         subject_id=subject_id, subject_guid=subject_guid, project=project
     )
+    if format != ResponseFormat.json:
+        batches = iter_page_batches(
+            client,
+            view_name="subjects_public",
+            query=query,
+            common=common,
+            key="_subject_id",
+            batch_size=settings.app_export_page_size,
+            response=response,
+        )
+        return tabular_response(
+            ([transform(c) for c in batch] for batch in batches),
+            Subject,
+            format,
+            filename="subjects",
+            headers=response.headers,
+        )
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in query_view_page(
+            client,
             view_name="subjects_public",
             query=query,
-            limit=common["limit"],
-            offset=common["offset"],
+            common=common,
+            key="_subject_id",
+            response=response,
         )
     ]
     return rows
@@ -54,8 +78,9 @@ def list_subjects(
     response_model=List[SubjectPrivate],
 )
 def list_subjects_with_limited_phi(
+    response: Response,
     client: VBR_Api = Depends(vbr_admin_client),
-    common=Depends(limit_offset),
+    common=Depends(limit_offset_cursor),
 ):
     """List Subjects including limited PHI.
 
@@ -63,11 +88,13 @@ def list_subjects_with_limited_phi(
     query = {}
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in query_view_page(
+            client,
             view_name="subjects_private",
             query=query,
-            limit=common["limit"],
-            offset=common["offset"],
+            common=common,
+            key="_subject_id",
+            response=response,
         )
     ]
     return rows
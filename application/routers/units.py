@@ -14,6 +14,7 @@ router = APIRouter(
     tags=["units"],
     responses={404: {"description": "Not found"}},
     route_class=LoggingRoute,
+    dependencies=[REFERENCE_CACHE_CONTROL],
 )
 
 
@@ -33,7 +34,8 @@ def list_units(
     query = parameters_to_query(unit_id=unit_id, name=name)
     rows = [
         transform(c)
-        for c in client.vbr_client.query_view_rows(
+        for c in cached_view_rows(
+            client,
             view_name="units_public",
             query=query,
             limit=common["limit"],
@@ -57,8 +59,8 @@ def get_unit_by_id(
     Requires: **VBR_READ_PUBLIC**"""
     query = {"unit_id": {"operator": "eq", "value": unit_id}}
     row = transform(
-        client.vbr_client.query_view_rows(
-            view_name="units_public", query=query, limit=1, offset=0
+        cached_view_rows(
+            client, view_name="units_public", query=query, limit=1, offset=0
         )[0]
     )
     return row
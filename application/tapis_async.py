@@ -0,0 +1,92 @@
+"""Non-blocking Tapis calls used by the async auth path"""
+from typing import List, Optional
+
+import httpx
+
+from .config import get_settings
+
+__all__ = [
+    "TapisResponseError",
+    "close_http_client",
+    "get_http_client",
+    "get_user_roles",
+    "get_username",
+    "refresh_tokens",
+]
+
+settings = get_settings()
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+class TapisResponseError(Exception):
+    """Tapis returned a non-success status code"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the pooled HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            base_url=settings.tapis_base_url,
+            timeout=settings.app_http_timeout,
+            limits=httpx.Limits(
+                max_connections=settings.app_http_pool_size,
+                max_keepalive_connections=settings.app_http_pool_size,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _result(resp: httpx.Response):
+    if resp.status_code >= 400:
+        try:
+            message = resp.json().get("message", resp.text)
+        except ValueError:
+            message = resp.text
+        raise TapisResponseError(resp.status_code, message)
+    return resp.json()["result"]
+
+
+async def _get_result(path: str, token: str, params: dict = None):
+    resp = await get_http_client().get(
+        path, params=params, headers={"X-Tapis-Token": token}
+    )
+    return _result(resp)
+
+
+async def get_username(token: str) -> str:
+    """Returns the username that a token belongs to."""
+    result = await _get_result("/v3/oauth2/userinfo", token)
+    return result["username"]
+
+
+async def get_user_roles(username: str, token: str) -> List[str]:
+    """Returns the SK roles, including inherited roles, granted to a user."""
+    result = await _get_result(
+        "/v3/security/user/roles/{0}".format(username),
+        token,
+        params={"tenant": settings.tapis_tenant_id},
+    )
+    return result["names"]
+
+
+async def refresh_tokens(refresh_token: str, client_id: str, client_key: str) -> dict:
+    """Exchange a refresh token for new access and refresh tokens."""
+    resp = await get_http_client().post(
+        "/v3/oauth2/tokens",
+        json={"grant_type": "refresh_token", "refresh_token": refresh_token},
+        auth=(client_id, client_key),
+    )
+    return _result(resp)
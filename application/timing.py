@@ -0,0 +1,93 @@
+"""Per-request timing spans reported in the Server-Timing header
+
+Spans are accumulated in a dict held in a context variable, which
+Starlette carries into the threads that run sync dependencies and
+endpoints, so every phase of a request adds to the same dict.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from .upstream import add_observer
+
+__all__ = [
+    "Spans",
+    "add_span",
+    "request_spans",
+    "server_timing",
+    "span",
+    "start_spans",
+]
+
+
+class Spans(dict):
+    """Maps span name to [seconds, count] for one request.
+
+    ended holds the perf_counter() time at which each span last ended.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.ended = {}
+
+
+_spans: ContextVar[Optional[Spans]] = ContextVar("server_timing", default=None)
+
+
+def start_spans() -> Spans:
+    """Start collecting spans for the current request."""
+    spans = Spans()
+    _spans.set(spans)
+    return spans
+
+
+def request_spans() -> Optional[Spans]:
+    """Returns the spans collected so far, or None outside a request."""
+    return _spans.get()
+
+
+def add_span(name: str, seconds: float) -> None:
+    """Add time to a named span of the current request, if there is one."""
+    spans = _spans.get()
+    if spans is None:
+        return
+    totals = spans.get(name)
+    if totals is None:
+        spans[name] = [seconds, 1]
+    else:
+        totals[0] += seconds
+        totals[1] += 1
+    spans.ended[name] = time.perf_counter()
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block as part of a named span."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, time.perf_counter() - start)
+
+
+def server_timing(spans: Dict) -> str:
+    """Returns spans formatted as a Server-Timing header value."""
+    return ", ".join(
+        '{0};dur={1:.1f};desc="{2} call{3}"'.format(
+            name, 1000 * seconds, count, "" if count == 1 else "s"
+        )
+        for name, (seconds, count) in spans.items()
+    )
+
+
+def upstream_span(name, args, kwargs, result, seconds, error) -> None:
+    """Upstream observer that adds Tapis calls to a "tapis" span and VBR
+    client calls to a "pgrest" span."""
+    if name.startswith(("sk.", "oauth2.")):
+        add_span("tapis", seconds)
+    else:
+        add_span("pgrest", seconds)
+
+
+add_observer(upstream_span)
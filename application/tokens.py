@@ -0,0 +1,172 @@
+"""Local verification of Tapis access tokens"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import jwt
+import requests
+from starlette.concurrency import run_in_threadpool
+
+from .config import get_settings
+
+__all__ = [
+    "KeyUnavailable",
+    "TenantKey",
+    "tenant_key",
+    "verify_token",
+    "verify_token_async",
+]
+
+settings = get_settings()
+
+log = logging.getLogger(__name__)
+
+# How long to keep using a stale key after a failed refresh before retrying
+RETRY_INTERVAL = 60.0
+
+
+class KeyUnavailable(Exception):
+    """The tenant public key could not be loaded."""
+
+
+class TenantKey(object):
+    """Caches the public key used by a Tapis tenant to sign its tokens.
+
+    The key is read from key_path if one is provided, which supports
+    offline deployments. Otherwise, it is fetched from the Tapis Tenants
+    API. Once start() is called, a timer reloads it shortly before it
+    goes stale, so requests do not wait on the Tenants API; get() still
+    reloads a stale key if the timer has fallen behind. If a refresh
+    fails, the previous key stays in use and the refresh is retried a
+    minute later.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        tenant_id: str,
+        key_path: Optional[str] = None,
+        refresh_interval: float = 3600.0,
+    ):
+        self.base_url = base_url
+        self.tenant_id = tenant_id
+        self.key_path = key_path
+        self.refresh_interval = refresh_interval
+        self._key = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def _load(self) -> str:
+        if self.key_path:
+            with open(self.key_path) as f:
+                return f.read()
+        resp = requests.get(
+            "{0}/v3/tenants/{1}".format(self.base_url, self.tenant_id), timeout=10
+        )
+        resp.raise_for_status()
+        return resp.json()["result"]["public_key"]
+
+    def refresh(self) -> str:
+        """Reload the key from its source.
+
+        Raises KeyUnavailable if it cannot be loaded and there is no
+        previous key to fall back on."""
+        with self._lock:
+            try:
+                self._key = self._load()
+                self._loaded_at = time.time()
+            except (OSError, requests.RequestException, KeyError, ValueError) as exc:
+                if self._key is None:
+                    raise KeyUnavailable(
+                        "Unable to load tenant public key: {0}".format(exc)
+                    )
+                retry_in = min(RETRY_INTERVAL, self.refresh_interval)
+                self._loaded_at = time.time() - self.refresh_interval + retry_in
+            return self._key
+
+    def age(self) -> float:
+        """Returns the number of seconds since the key was loaded."""
+        return time.time() - self._loaded_at
+
+    def stale(self) -> bool:
+        """Returns True if get() would reload the key."""
+        return self._key is None or self.age() > self.refresh_interval
+
+    def get(self) -> str:
+        """Returns the cached key, reloading it if it is stale."""
+        if self.stale():
+            return self.refresh()
+        return self._key
+
+    def _tick(self) -> None:
+        try:
+            self.refresh()
+        except KeyUnavailable as exc:
+            log.warning("%s; retrying in %d seconds", exc, RETRY_INTERVAL)
+        finally:
+            self._schedule()
+
+    def _schedule(self) -> None:
+        # A minute before the key goes stale, and at most once a minute
+        stale_in = self._loaded_at + self.refresh_interval - time.time()
+        delay = max(stale_in - RETRY_INTERVAL, RETRY_INTERVAL)
+        self._timer = threading.Timer(delay, self._tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def start(self) -> None:
+        """Load the key, then keep it fresh in the background.
+
+        A failed first load is logged rather than raised; verification
+        retries it, and so does the timer a minute later."""
+        if self._timer is None:
+            self._tick()
+
+    def stop(self) -> None:
+        """Stop the background refresh."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+tenant_key = TenantKey(
+    base_url=settings.tapis_base_url,
+    tenant_id=settings.tapis_tenant_id,
+    key_path=settings.tapis_jwt_public_key_path,
+    refresh_interval=settings.tapis_jwt_key_refresh,
+)
+
+
+def verify_token(token: str, key: TenantKey = tenant_key) -> Dict:
+    """Verify a Tapis token signature and expiry, returning its claims.
+
+    If the signature check fails, the tenant key is reloaded (at most once
+    a minute) in case it has been rotated. Raises
+    jwt.exceptions.InvalidTokenError if the token is not valid, or
+    KeyUnavailable if the tenant key cannot be loaded.
+    """
+    try:
+        return jwt.decode(token, key.get(), algorithms=["RS256"])
+    except jwt.exceptions.InvalidSignatureError:
+        if key.age() < RETRY_INTERVAL:
+            raise
+        return jwt.decode(token, key.refresh(), algorithms=["RS256"])
+
+
+async def verify_token_async(token: str, key: TenantKey = tenant_key) -> Dict:
+    """Non-blocking version of verify_token.
+
+    Only reloading the key blocks, so that is done in the threadpool and
+    the signature check stays on the event loop.
+    """
+    if key.stale():
+        await run_in_threadpool(key.get)
+    try:
+        return jwt.decode(token, key.get(), algorithms=["RS256"])
+    except jwt.exceptions.InvalidSignatureError:
+        if key.age() < RETRY_INTERVAL:
+            raise
+        public_key = await run_in_threadpool(key.refresh)
+        return jwt.decode(token, public_key, algorithms=["RS256"])
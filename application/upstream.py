@@ -0,0 +1,146 @@
+"""Instrumentation of calls made to upstream services
+
+Calls are reported to observers, such as the metrics and Server-Timing
+spans, and recorded in a per-request trace that is written to the slow
+request log when a request takes too long.
+"""
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable, List, Optional
+
+__all__ = [
+    "InstrumentedProxy",
+    "Trace",
+    "add_observer",
+    "current_trace",
+    "start_trace",
+    "upstream_call",
+]
+
+# Calls recorded per request, beyond which only a count is kept
+MAX_TRACE_CALLS = 1000
+
+# Callables of (name, args, kwargs, result, seconds, error), notified after
+# every upstream call made through an InstrumentedProxy or upstream_call
+observers: List[Callable] = []
+
+
+def add_observer(observer: Callable) -> None:
+    """Register a callable to be notified of every upstream call."""
+    observers.append(observer)
+
+
+def _notify(name, args, kwargs, result, seconds, error) -> None:
+    for observer in observers:
+        observer(name, args, kwargs, result, seconds, error)
+
+
+class Trace(list):
+    """The upstream calls made while handling one request"""
+
+    def __init__(self):
+        super().__init__()
+        self.start = time.perf_counter()
+        self.dropped = 0
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("upstream_trace", default=None)
+
+
+def start_trace() -> Trace:
+    """Start recording upstream calls for the current request."""
+    trace = Trace()
+    _trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    """Returns the calls recorded so far, or None outside a request."""
+    return _trace.get()
+
+
+def _record_call(name, args, kwargs, result, seconds, error) -> None:
+    """Private: Observer that adds each call to the current trace."""
+    trace = _trace.get()
+    if trace is None:
+        return
+    if len(trace) >= MAX_TRACE_CALLS:
+        trace.dropped += 1
+        return
+    entry = {
+        "call": name,
+        "at_ms": round(1000 * (time.perf_counter() - seconds - trace.start), 3),
+        "ms": round(1000 * seconds, 3),
+    }
+    if args:
+        entry["args"] = list(args)
+    if kwargs:
+        entry["kwargs"] = kwargs
+    if isinstance(result, (list, tuple)):
+        entry["rows"] = len(result)
+    if error is not None:
+        entry["error"] = repr(error)
+    trace.append(entry)
+
+
+observers.append(_record_call)
+
+
+@contextmanager
+def upstream_call(name: str, **details):
+    """Time and report an upstream call made without an InstrumentedProxy.
+
+    Used for Tapis calls, which are named "sk.*" or "oauth2.*".
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        _notify(name, (), details, None, time.perf_counter() - start, error)
+
+
+class InstrumentedProxy(object):
+    """Wraps a client so each method call made through it is timed.
+
+    Attributes named in nested are wrapped in turn, with their calls
+    reported as "<attribute>.<method>", so calls such as
+    client.vbr_client.query_view_rows are seen as well. Everything else
+    is passed through untouched.
+    """
+
+    def __init__(self, target, prefix: str = "", nested: Iterable[str] = ()):
+        self._target = target
+        self._prefix = prefix
+        self._nested = tuple(nested)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if name in self._nested:
+            return InstrumentedProxy(attr, prefix=self._prefix + name + ".")
+        if not callable(attr) or name.startswith("_"):
+            return attr
+        call_name = self._prefix + name
+
+        @functools.wraps(attr)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = None
+            error = None
+            try:
+                result = attr(*args, **kwargs)
+                return result
+            except Exception as exc:
+                error = exc
+                raise
+            finally:
+                _notify(
+                    call_name, args, kwargs, result, time.perf_counter() - start, error
+                )
+
+        return timed
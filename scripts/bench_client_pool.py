@@ -0,0 +1,89 @@
+"""Benchmark per-request Tapis client construction with and without pooling.
+
+Simulates the auth dependencies resolving a user client twice per request
+(once for tapis_user, once for tapis_roles) for a handful of callers.
+Only client construction is timed. The unpooled case builds clients the
+way _client() used to, which includes tapipy listing tenants from the
+Tapis base URL on every construction.
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+import jwt
+from tapipy.tapis import Tapis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from application.clients import ClientPool
+
+
+def fake_token(username: str) -> str:
+    claims = {
+        "jti": str(uuid.uuid4()),
+        "tapis/username": username,
+        "tapis/tenant_id": "tacc",
+        "exp": int(time.time()) + 3600,
+    }
+    token = jwt.encode(claims, "not-a-real-key", algorithm="HS256")
+    if isinstance(token, bytes):
+        token = token.decode("utf-8")
+    return token
+
+
+def run(label, get_client, tokens, requests_per_token):
+    start = time.perf_counter()
+    count = 0
+    for _ in range(requests_per_token):
+        for token in tokens:
+            # tapis_user and tapis_roles each resolve a client
+            get_client(token)
+            get_client(token)
+            count += 1
+    elapsed = time.perf_counter() - start
+    print(
+        "{0:>10}: {1} requests in {2:.3f}s ({3:.2f} ms/request)".format(
+            label, count, elapsed, 1000 * elapsed / count
+        )
+    )
+
+
+def main(arg_vals):
+    tokens = [fake_token("user{0}".format(i)) for i in range(arg_vals["users"])]
+
+    def unpooled(token):
+        return Tapis(base_url=arg_vals["base_url"], access_token=token)
+
+    pool = ClientPool(base_url=arg_vals["base_url"], tenant_id=arg_vals["tenant_id"])
+
+    run("unpooled", unpooled, tokens, arg_vals["requests"])
+    run("pooled", pool.get, tokens, arg_vals["requests"])
+    print(pool.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-H",
+        type=str,
+        default=os.environ.get("TAPIS_BASE_URL", "https://tacc.tapis.io"),
+        dest="base_url",
+        help="Tapis API Base URL",
+    )
+    parser.add_argument(
+        "-T",
+        type=str,
+        default=os.environ.get("TAPIS_TENANT_ID", "tacc"),
+        dest="tenant_id",
+        help="Tapis Tenant ID",
+    )
+    parser.add_argument(
+        "-u", type=int, default=8, dest="users", help="Number of distinct tokens"
+    )
+    parser.add_argument(
+        "-n", type=int, default=25, dest="requests", help="Requests per token"
+    )
+    args = parser.parse_args()
+    main(vars(args))
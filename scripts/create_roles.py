@@ -1,46 +1,12 @@
 import os
+import sys
 import argparse
 from tapipy.tapis import Tapis
 
-DEFAULT_ROLE = ("VBR_USER", "Default user role")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# VBR_ADMIN
-# - VBR_READ_ANY_PHI
-#   - VBR_READ_LIMITED_PHI
-#     - VBR_READ_PUBLIC
-#
-# VBR_ADMIN
-# - VBR_WRITE_ANY
-#   - VBR_WRITE_PUBLIC
-#
-# VBR_WRITE_ANY
-# - VBR_READ_ANY_PHI
-
-ROLES = [
-    ("VBR_ADMIN", "VBR Administrator"),
-    ("VBR_READ_ANY_PHI", "Can read any PHI data"),
-    ("VBR_READ_LIMITED_PHI", "Can read limited PHI data"),
-    ("VBR_READ_PUBLIC", "Can read only public data"),
-    ("VBR_WRITE_ANY", "Can write admin privileged fields and endpoints"),
-    ("VBR_WRITE_PUBLIC", "Can write only public fields and endpoints"),
-    DEFAULT_ROLE,
-]
-# (Parent, Child)
-RELATIONS = [
-    ("VBR_ADMIN", "VBR_WRITE_ANY"),  # Admin can write anything,
-    ("VBR_WRITE_ANY", "VBR_WRITE_PUBLIC"),
-    ("VBR_ADMIN", "VBR_READ_ANY_PHI"),  # Admin can read all PHI
-    ("VBR_READ_ANY_PHI", "VBR_READ_LIMITED_PHI"),  # Any PHI can read Limited PHI
-    ("VBR_READ_ANY_PHI", "VBR_READ_PUBLIC"),  # Limited PHI can read public
-    (
-        "VBR_WRITE_ANY",
-        "VBR_READ_ANY_PHI",
-    ),  # Anyone who can write ANY can read ANY
-    (
-        "VBR_WRITE_PUBLIC",
-        "VBR_READ_PUBLIC",
-    ),  # Anyone who can write public can read public
-]
+# Roles and relations are shared with the API's role guards
+from application.roles import DEFAULT_ROLE, RELATIONS, ROLES
 
 
 def main(arg_vals):
@@ -0,0 +1,203 @@
+"""Load test the auth dependencies against a local stub Tapis server.
+
+Starts a stub that answers the userinfo, SK role and token endpoints
+after a fixed delay, then runs the API twice, once with the blocking
+auth path and once with APP_ASYNC_AUTH, and fires concurrent requests
+at /status/auth using a distinct token per request. Identity and role
+caching are disabled so every request goes upstream.
+
+    python scripts/loadtest_auth.py -c 200 -n 800 -d 0.2
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import httpx
+import jwt
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_token(username: str) -> str:
+    claims = {
+        "jti": str(uuid.uuid4()),
+        "tapis/username": username,
+        "tapis/tenant_id": "tacc",
+        "exp": int(time.time()) + 3600,
+    }
+    token = jwt.encode(claims, "not-a-real-key", algorithm="HS256")
+    if isinstance(token, bytes):
+        token = token.decode("utf-8")
+    return token
+
+
+def stub_tapis(delay: float) -> Starlette:
+    """A stand-in for the handful of Tapis endpoints the auth path calls"""
+
+    async def userinfo(request):
+        await asyncio.sleep(delay)
+        claims = jwt.decode(
+            request.headers["x-tapis-token"], options={"verify_signature": False}
+        )
+        return JSONResponse(
+            {"status": "success", "result": {"username": claims["tapis/username"]}}
+        )
+
+    async def user_roles(request):
+        await asyncio.sleep(delay)
+        return JSONResponse(
+            {"status": "success", "result": {"names": ["VBR_USER", "VBR_READ_PUBLIC"]}}
+        )
+
+    async def tokens(request):
+        token = make_token("service")
+        return JSONResponse(
+            {
+                "status": "success",
+                "result": {
+                    "access_token": {
+                        "access_token": token,
+                        "expires_in": 3600,
+                    }
+                },
+            },
+            status_code=201,
+        )
+
+    return Starlette(
+        routes=[
+            Route("/v3/oauth2/userinfo", userinfo),
+            Route("/v3/security/user/roles/{user}", user_roles),
+            Route("/v3/oauth2/tokens", tokens, methods=["POST"]),
+        ]
+    )
+
+
+def wait_for(url: str, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError("{0} did not come up".format(url))
+
+
+async def fire(url: str, total: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async with httpx.AsyncClient(timeout=120.0) as client:
+
+        async def one(i):
+            nonlocal failures
+            headers = {"Authorization": "Bearer " + make_token("user{0}".format(i))}
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await client.get(url, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                if resp.status_code != 200:
+                    failures += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(total)])
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return elapsed, latencies, failures
+
+
+def run_api(label: str, arg_vals: dict, stub_url: str, port: int) -> None:
+    env = dict(os.environ)
+    env.update(
+        {
+            "TAPIS_BASE_URL": stub_url,
+            "APP_ASYNC_AUTH": "true" if label == "async" else "false",
+            "APP_ROLE_CACHE_TTL": "0",
+            "APP_LOG_PATH": arg_vals["log_path"],
+        }
+    )
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "application.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+    try:
+        wait_for("http://127.0.0.1:{0}/status".format(port))
+        elapsed, latencies, failures = asyncio.run(
+            fire(
+                "http://127.0.0.1:{0}/status/auth".format(port),
+                arg_vals["requests"],
+                arg_vals["concurrency"],
+            )
+        )
+        print(
+            "{0:>6}: {1} requests in {2:.2f}s = {3:.1f} req/s; "
+            "p50 {4:.0f} ms, p95 {5:.0f} ms; {6} failed".format(
+                label,
+                len(latencies),
+                elapsed,
+                len(latencies) / elapsed,
+                1000 * latencies[len(latencies) // 2],
+                1000 * latencies[int(len(latencies) * 0.95)],
+                failures,
+            )
+        )
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main(arg_vals):
+    stub = uvicorn.Server(
+        uvicorn.Config(
+            stub_tapis(arg_vals["delay"]),
+            port=arg_vals["stub_port"],
+            log_level="warning",
+        )
+    )
+    threading.Thread(target=stub.run, daemon=True).start()
+    stub_url = "http://127.0.0.1:{0}".format(arg_vals["stub_port"])
+    wait_for(stub_url)
+    for label in ("sync", "async"):
+        run_api(label, arg_vals, stub_url, arg_vals["port"])
+    stub.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", type=int, default=800, dest="requests", help="Total requests"
+    )
+    parser.add_argument(
+        "-c", type=int, default=200, dest="concurrency", help="Concurrent requests"
+    )
+    parser.add_argument(
+        "-d", type=float, default=0.2, dest="delay", help="Stub Tapis latency (s)"
+    )
+    parser.add_argument("--port", type=int, default=8765, help="API port")
+    parser.add_argument("--stub-port", type=int, default=8766, dest="stub_port")
+    parser.add_argument(
+        "--log-path", type=str, default="/tmp", dest="log_path", help="Audit log dir"
+    )
+    args = parser.parse_args()
+    main(vars(args))
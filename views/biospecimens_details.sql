@@ -39,3 +39,4 @@ INNER JOIN a2cps.containers_base
     ON biospecimens_base.container_id = containers_base.container_id
 INNER JOIN a2cps.protocol
     ON biospecimens_base.protocol = protocol.protocol_id
+ORDER BY biospecimens_base._measurement_id ASC
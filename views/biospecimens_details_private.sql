@@ -46,3 +46,4 @@ INNER JOIN a2cps.subjects_private
     ON collections_base.subject_id = subjects_private.subject_id
 INNER JOIN a2cps.protocol
     ON biospecimens_base.protocol = protocol.protocol_id
+ORDER BY biospecimens_base._measurement_id ASC
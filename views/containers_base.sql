@@ -1,5 +1,7 @@
 SELECT
     container.container_id AS _container_id,
+    container.container_id::bigint * 4294967296
+        + COALESCE(ship.shipment_id, 0) AS _container_row_id,
     container.local_id AS container_id,
     container.tracking_id AS container_tracking_id,
     container_type.name as container_type,
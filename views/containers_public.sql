@@ -1 +1,2 @@
 SELECT * FROM a2cps.containers_base
+ORDER BY _container_row_id ASC
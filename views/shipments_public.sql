@@ -1 +1,2 @@
 SELECT * FROM a2cps.shipments_base
+ORDER BY _shipment_id ASC
@@ -13,4 +13,5 @@ FROM
     a2cps.subjects_base
 INNER JOIN
     a2cps.rcap_patient_demographics_baseline_v03_demographics_i demographics
-    ON demographics.subject_id = subjects_base._subject_id;
+    ON demographics.subject_id = subjects_base._subject_id
+ORDER BY subjects_base._subject_id ASC;
@@ -5,4 +5,5 @@ SELECT
     subjects_base.subject_guid,
     subjects_base.project
 FROM
-    a2cps.subjects_base;
+    a2cps.subjects_base
+ORDER BY subjects_base._subject_id ASC;